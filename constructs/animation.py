@@ -0,0 +1,147 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from constructs.batch import load_specs, write_png, FORMATS
+from constructs.calc import data_regen
+from constructs.model import PlotSpecs, CMAP_EXT
+from constructs.palette import PALETTES, colorize
+
+KEYFRAME_ZOOM = 2.0  # zoom factor from one keyframe to the next, and how much keyframes are oversampled
+
+
+def zoom_path(start: PlotSpecs, end: PlotSpecs):
+    """
+    The zoom from start to end as the fixed point (px, py) that both views scale around and the scale of end relative to start.
+    Every view on the way is start scaled around that point, so that a view is contained in every wider one.
+    """
+    scale = (np.longdouble(end.xmax) - np.longdouble(end.xmin)) / (np.longdouble(start.xmax) - np.longdouble(start.xmin))
+    if abs(scale - 1) < 1e-12:
+        raise ValueError("The start and end views have the same width: a zoom sequence needs a zoom")
+    px = ((np.longdouble(end.xmin) + np.longdouble(end.xmax)) / 2 - (np.longdouble(start.xmin) + np.longdouble(start.xmax)) / 2 * scale) / (1 - scale)
+    py = ((np.longdouble(end.ymin) + np.longdouble(end.ymax)) / 2 - (np.longdouble(start.ymin) + np.longdouble(start.ymax)) / 2 * scale) / (1 - scale)
+    return px, py, float(scale)
+
+
+def scaled_specs(start: PlotSpecs, px, py, scale, iterations, width, height) -> PlotSpecs:
+    return PlotSpecs(px + (np.longdouble(start.xmin) - px) * scale, px + (np.longdouble(start.xmax) - px) * scale,
+                     py + (np.longdouble(start.ymin) - py) * scale, py + (np.longdouble(start.ymax) - py) * scale,
+                     iterations, width, height)
+
+
+def frame_scales(end_scale, frames) -> np.ndarray:
+    """
+    Scales of the frames relative to the start view, evenly spaced in zoom.
+    """
+    return end_scale ** (np.arange(frames) / max(frames - 1, 1))
+
+
+def keyframe_scales(scales: np.ndarray, zoom=KEYFRAME_ZOOM) -> np.ndarray:
+    """
+    Scales of the keyframes, zoom apart from the widest frame down to the narrowest one.
+    """
+    count = int(np.floor(np.log(scales.max() / scales.min()) / np.log(zoom) + 1e-9)) + 1
+    return scales.max() / zoom ** np.arange(count)
+
+
+def keyframe_index(scales: np.ndarray, key_scales: np.ndarray, zoom=KEYFRAME_ZOOM) -> np.ndarray:
+    """
+    For every frame, the narrowest keyframe that contains it: the frame is at most zoom times narrower,
+    so the keyframe, oversampled by zoom, has at least as many pixels across the frame as the frame itself.
+    """
+    index = np.floor(np.log(key_scales[0] / scales) / np.log(zoom) + 1e-9).astype(int)
+    return np.clip(index, 0, len(key_scales) - 1)
+
+
+def resample(img: np.ndarray, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """
+    Sample the RGB image bilinearly at the fractional columns u and rows v.
+    """
+    u0 = np.clip(np.floor(u).astype(int), 0, img.shape[1] - 2)
+    v0 = np.clip(np.floor(v).astype(int), 0, img.shape[0] - 2)
+    fu = np.clip(u - u0, 0, 1).astype(np.float32)[np.newaxis, :, np.newaxis]
+    fv = np.clip(v - v0, 0, 1).astype(np.float32)[:, np.newaxis, np.newaxis]
+    rows0, rows1 = img[v0].astype(np.float32), img[v0 + 1].astype(np.float32)
+    top = rows0[:, u0] * (1 - fu) + rows0[:, u0 + 1] * fu
+    bottom = rows1[:, u0] * (1 - fu) + rows1[:, u0 + 1] * fu
+    return np.rint(top * (1 - fv) + bottom * fv).astype(np.uint8)
+
+
+def render_keyframe(start: PlotSpecs, end: PlotSpecs, px, py, scale, end_scale, zoom=KEYFRAME_ZOOM, palette='linear') -> np.ndarray:
+    """
+    Color the keyframe at the given scale, zoom times the frame resolution, its iterations interpolated in zoom between start and end.
+    Every keyframe is normalized to the most iterations of the sequence, so that an escape count keeps its color from frame to frame.
+    Keyframes are oversampled views nobody browses, so like batch renders they stay out of the interactive cache.
+    """
+    t = min(max(np.log(scale) / np.log(end_scale), 0), 1)
+    iterations = round(start.iterations + (end.iterations - start.iterations) * t)
+    specs = scaled_specs(start, px, py, scale, iterations, round(start.width * zoom), round(start.height * zoom))
+    dataset = data_regen(specs, None, commit=False)
+    return colorize(dataset.escapes, dataset.interior, CMAP_EXT, palette, vmax=max(start.iterations, end.iterations))
+
+
+def zoom_frames(start: PlotSpecs, end: PlotSpecs, frames, zoom=KEYFRAME_ZOOM, palette='linear'):
+    """
+    Yield the frames of the zoom from start to end as (n, RGB image top to bottom) in order, as soon as each is ready.
+    Only the keyframes are computed, a thread computing the next one while the frames of the current one are resampled from it.
+    """
+    px, py, end_scale = zoom_path(start, end)
+    scales = frame_scales(end_scale, frames)
+    key_scales = keyframe_scales(scales, zoom)
+    index = keyframe_index(scales, key_scales, zoom)
+    order = list(dict.fromkeys(index.tolist()))  # keyframes in the order the frames need them
+    print(f"Keyframes: {len(order)} for {frames} frame(s), {len(order) * zoom ** 2 / frames:.0%} of the pixels of rendering every frame")
+
+    # columns and rows of a frame at scale 1, as offsets from the fixed point
+    ax = np.linspace(np.longdouble(start.xmin) - px, np.longdouble(start.xmax) - px, start.width)
+    ay = np.linspace(np.longdouble(start.ymin) - py, np.longdouble(start.ymax) - py, start.height)
+    key_width, key_height = round(start.width * zoom), round(start.height * zoom)
+    with ThreadPoolExecutor(max_workers=1) as keyframer:
+        pending = keyframer.submit(render_keyframe, start, end, px, py, key_scales[order[0]], end_scale, zoom, palette)
+        for position, k in enumerate(order):
+            keyframe = pending.result()
+            if position + 1 < len(order):
+                pending = keyframer.submit(render_keyframe, start, end, px, py, key_scales[order[position + 1]], end_scale, zoom, palette)
+            for n in np.flatnonzero(index == k).tolist():
+                ratio = scales[n] / key_scales[k]
+                u = ((ax * ratio - ax[0]) / (ax[-1] - ax[0]) * (key_width - 1)).astype(np.float64)
+                v = ((ay * ratio - ay[0]) / (ay[-1] - ay[0]) * (key_height - 1)).astype(np.float64)
+                yield n, resample(keyframe, u, v)[::-1]
+
+
+def render_zoom(start: PlotSpecs, end: PlotSpecs, frames, out_dir, fmt='png', zoom=KEYFRAME_ZOOM, palette='linear') -> list[str]:
+    """
+    Write the frames of the zoom from start to end to out_dir as frame-<n>.<fmt>, each as soon as it is ready.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    start_time = time.perf_counter()
+    for n, rgb in zoom_frames(start, end, frames, zoom, palette):
+        path = os.path.join(out_dir, f"frame-{n:05d}.{fmt}")
+        if fmt == 'png':
+            write_png(path, [rgb], rgb.shape[1], rgb.shape[0])
+        else:
+            np.save(path, rgb)
+        paths.append(path)
+    print(f"Rendered {frames} frame(s) in {time.perf_counter() - start_time:.1f} s")
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a zoom from one view of the Mandelbrot set to another as a sequence of frames.")
+    parser.add_argument('specs', help="JSON or CSV file of PlotSpecs: the start view then the end view")
+    parser.add_argument('-n', '--frames', type=int, default=100)
+    parser.add_argument('-o', '--out', default='frames', help="output directory")
+    parser.add_argument('-f', '--format', choices=FORMATS, default='png', help="PNG images or raw RGB .npy arrays")
+    parser.add_argument('-z', '--zoom', type=float, default=KEYFRAME_ZOOM, help="zoom factor between keyframes")
+    parser.add_argument('-p', '--palette', choices=PALETTES, default='linear')
+    args = parser.parse_args(argv)
+    start, end = load_specs(args.specs)[:2]
+    render_zoom(start, end, args.frames, args.out, args.format, args.zoom, args.palette)
+
+
+if __name__ == '__main__':
+    main()
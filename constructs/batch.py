@@ -0,0 +1,163 @@
+import argparse
+import csv
+import json
+import os
+import struct
+import tempfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import astuple, fields
+
+import numpy as np
+
+from constructs.calc import data_regen
+from constructs.model import PlotSpecs, CMAP_EXT
+from constructs.palette import PALETTES, colorize, palette_counts, LUT_SIZE
+
+BATCH_BLOCK = 2048  # pixels per side of the blocks a view is rendered in, which bounds the memory of a render
+FORMATS = ('png', 'npy')
+
+
+def load_specs(path) -> list[PlotSpecs]:
+    """
+    Read views from a JSON list of PlotSpecs, as objects or as lists of fields,
+    or from a CSV file with a header row of PlotSpecs fields. Fields left out or empty take the PlotSpecs defaults.
+    """
+    if os.path.splitext(path)[1].lower() == '.csv':
+        with open(path, newline='') as f:
+            rows = [{key: value for key, value in row.items() if value not in (None, '')} for row in csv.DictReader(f)]
+    else:
+        with open(path) as f:
+            rows = json.load(f)
+    types = {field.name: int if field.name in ('iterations', 'width', 'height') else float for field in fields(PlotSpecs)}
+    specs = []
+    for row in rows:
+        if not isinstance(row, dict):
+            row = dict(zip(types, row))
+        specs.append(PlotSpecs(**{key: types[key](value) for key, value in row.items()}))
+    return specs
+
+
+def block_specs(specs: PlotSpecs, r0, r1, c0, c1) -> PlotSpecs:
+    """
+    The part of the view covering rows r0:r1 and columns c0:c1 of its pixels, on the same pixel grid as the whole view.
+    """
+    x0, x1 = np.longdouble(specs.xmin), np.longdouble(specs.xmax)
+    y0, y1 = np.longdouble(specs.ymin), np.longdouble(specs.ymax)
+    dx, dy = (x1 - x0) / max(specs.width - 1, 1), (y1 - y0) / max(specs.height - 1, 1)
+    return PlotSpecs(x0 + c0 * dx, x0 + (c1 - 1) * dx, y0 + r0 * dy, y0 + (r1 - 1) * dy, specs.iterations, c1 - c0, r1 - r0)
+
+
+def render_blocks(specs: PlotSpecs, directory, block=BATCH_BLOCK):
+    """
+    Render the view block by block into memory-mapped escapes and interior arrays in directory, rows bottom to top.
+    Only one block is held in memory at a time, whatever the size of the view, and nothing goes to the interactive cache.
+    """
+    shape = (specs.height, specs.width)
+    escapes = np.lib.format.open_memmap(os.path.join(directory, 'escapes.npy'), 'w+', np.float64, shape)
+    interior = np.lib.format.open_memmap(os.path.join(directory, 'interior.npy'), 'w+', bool, shape)
+    for r0 in range(0, specs.height, block):
+        for c0 in range(0, specs.width, block):
+            r1, c1 = min(r0 + block, specs.height), min(c0 + block, specs.width)
+            dataset = data_regen(block_specs(specs, r0, r1, c0, c1), None, commit=False)
+            escapes[r0:r1, c0:c1], interior[r0:r1, c0:c1] = dataset.escapes, dataset.interior
+            del dataset
+    escapes.flush()
+    interior.flush()
+    return escapes, interior
+
+
+def color_rows(escapes: np.ndarray, interior: np.ndarray, palette='linear', block=BATCH_BLOCK):
+    """
+    Color the image block rows at a time, top to bottom, normalized over the whole image.
+    """
+    bands = range(0, escapes.shape[0], block)
+    vmax = max((escapes[r0:r0 + block].max(initial=0) for r0 in bands), default=0)
+    counts = None
+    if palette == 'histogram':
+        counts = sum((palette_counts(escapes[r0:r0 + block], interior[r0:r0 + block], vmax) for r0 in bands), np.zeros(LUT_SIZE, dtype=np.int64))
+    for r1 in range(escapes.shape[0], 0, -block):
+        r0 = max(r1 - block, 0)
+        yield colorize(escapes[r0:r1], interior[r0:r1], CMAP_EXT, palette, vmax=vmax, counts=counts)[::-1]
+
+
+def write_png(path, rows, width, height):
+    """
+    Write an 8-bit RGB PNG from blocks of rows, top to bottom, compressing them as they come.
+    """
+    compressor = zlib.compressobj(6)
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        png_chunk(f, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        for rgb in rows:
+            scanlines = np.zeros((rgb.shape[0], 1 + width * 3), dtype=np.uint8)  # filter byte 0 in front of every row
+            scanlines[:, 1:] = rgb.reshape(rgb.shape[0], -1)
+            data = compressor.compress(scanlines.tobytes())
+            if data:
+                png_chunk(f, b'IDAT', data)
+        png_chunk(f, b'IDAT', compressor.flush())
+        png_chunk(f, b'IEND', b'')
+
+
+def png_chunk(f, kind: bytes, data: bytes):
+    f.write(struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data)))
+
+
+def write_npy(path, rows, width, height):
+    """
+    Write the RGB image, top to bottom, as a memory-mapped .npy of shape (height, width, 3).
+    """
+    out = np.lib.format.open_memmap(path, 'w+', np.uint8, (height, width, 3))
+    r0 = 0
+    for rgb in rows:
+        out[r0:r0 + rgb.shape[0]] = rgb
+        r0 += rgb.shape[0]
+    out.flush()
+
+
+def write_view(path, fmt, escapes: np.memmap, interior: np.memmap, palette='linear', block=BATCH_BLOCK):
+    """
+    Color and write a view rendered by render_blocks, then delete its memory-mapped arrays.
+    """
+    write = write_png if fmt == 'png' else write_npy
+    write(path, color_rows(escapes, interior, palette, block), escapes.shape[1], escapes.shape[0])
+    os.remove(escapes.filename)
+    os.remove(interior.filename)
+    return path
+
+
+def render_batch(specs_list, out_dir, fmt='png', palette='linear', block=BATCH_BLOCK) -> list[str]:
+    """
+    Render every view to out_dir as view-<n>.<fmt>. Every view is computed across the whole worker pool,
+    while a writer thread colors and writes the previous one.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=out_dir) as directory, ThreadPoolExecutor(max_workers=1) as writer:
+        pending = []
+        for n, specs in enumerate(specs_list):
+            start_time = time.perf_counter()
+            work = os.path.join(directory, str(n))
+            os.mkdir(work)
+            escapes, interior = render_blocks(specs, work, block)
+            print(f"Rendered {specs.width}x{specs.height} PlotSpecs{astuple(specs)} in {time.perf_counter() - start_time:.1f} s")
+            path = os.path.join(out_dir, f"view-{n:04d}.{fmt}")
+            pending.append(writer.submit(write_view, path, fmt, escapes, interior, palette, block))
+            del escapes, interior
+        return [future.result() for future in pending]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render views of the Mandelbrot set to image files, without a display.")
+    parser.add_argument('specs', help="JSON or CSV file of PlotSpecs")
+    parser.add_argument('-o', '--out', default='renders', help="output directory")
+    parser.add_argument('-f', '--format', choices=FORMATS, default='png', help="PNG image or raw RGB .npy array")
+    parser.add_argument('-p', '--palette', choices=PALETTES, default='linear')
+    parser.add_argument('-b', '--block', type=int, default=BATCH_BLOCK, help="pixels per side of the blocks rendered at a time")
+    args = parser.parse_args(argv)
+    for path in render_batch(load_specs(args.specs), args.out, args.format, args.palette, args.block):
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
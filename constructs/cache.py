@@ -1,45 +1,158 @@
 import glob
+import json
 import os
+import shutil
 from bisect import bisect_left, bisect
 from collections import defaultdict, OrderedDict
-from dataclasses import astuple
+from dataclasses import astuple, replace
 
 import numpy as np
 
 from constructs.model import PlotSpecs, MandelbrotData
+from constructs.tiles import tile_specs
 
 FILE_PREFIX = 'tmp'
+INDEX_FILENAME = f'{FILE_PREFIX}-index.json'
+RAM_BUDGET = 2 ** 30  # bytes of datasets kept in memory
+DISK_BUDGET = 4 * 2 ** 30  # bytes of cache files kept on disk
+ESCAPES_DTYPE = np.float32  # smoothed escape counts keep ~7 significant digits on disk
+STORE_Z = True  # without Z, cached datasets cannot be continued to more iterations
+MMAP_MIN_BYTES = 2 ** 20  # smaller escapes, e.g. every tile, are read into memory: each memory map kept in the RAM tier holds a file descriptor
 
 
 class CacheManager:
-    def __init__(self, cache_dir=None):
+    """
+    Two tiers, each bounded in bytes and evicting the least recently used entries:
+    the datasets last committed or loaded are kept in memory, and every committed dataset is saved to disk.
+    The disk tier is listed in an index file in cache_dir, from which a new CacheManager picks it up again.
+    The index is written by save_index once per render rather than on every commit, see constructs.calc.
+    Every entry on disk is a directory with one .npy file per field; the escapes of large entries are loaded as memory maps,
+    so that reading an entry only pages in what is actually used. Z is only read for continuations.
+    """
+
+    def __init__(self, cache_dir=None, ram_budget=RAM_BUDGET, disk_budget=DISK_BUDGET):
         self.cache_dir = cache_dir or os.path.dirname(__file__)
-        self.directory = defaultdict(dict)
+        self.ram_budget = ram_budget
+        self.disk_budget = disk_budget
+        self.directory = defaultdict(dict)  # whole viewports of deep zooms
+        self.tiles = defaultdict(dict)  # (level, tx, ty) -> {iterations: filename}, the index of the tile quadtree
+        self.ram = OrderedDict()  # filename -> MandelbrotData, least recently used first
+        self.ram_bytes = 0
+        self.disk = OrderedDict()  # filename -> (kind, key, iterations, size), least recently used first
+        self.disk_bytes = 0
+        self.index_dirty = False  # whether the disk tier changed since the index file was written
+        self.load_index()
+
+    def index_filename(self):
+        return os.path.join(self.cache_dir, INDEX_FILENAME)
+
+    def load_index(self):
+        """
+        Rebuild the in-memory indices from the index file, skipping the entries whose file is gone.
+        """
+        try:
+            with open(self.index_filename()) as f:
+                records = json.load(f)
+        except (OSError, ValueError):
+            return
+        for record in records:
+            filename = os.path.join(self.cache_dir, record['filename'])
+            if os.path.exists(filename):
+                self.register(filename, record['kind'], tuple(record['key']), record['iterations'], record['size'])
+
+    def save_index(self):
+        if not self.index_dirty:
+            return
+        records = [dict(filename=os.path.basename(filename), kind=kind, key=list(key), iterations=iterations, size=size)
+                   for filename, (kind, key, iterations, size) in self.disk.items()]
+        tmp_filename = self.index_filename() + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump(records, f)
+        os.replace(tmp_filename, self.index_filename())
+        self.index_dirty = False
+
+    def register(self, filename, kind, key, iterations, size):
+        index = self.directory if kind == 'view' else self.tiles
+        index[key][iterations] = filename
+        previous = self.disk.pop(filename, None)
+        if previous is not None:
+            self.disk_bytes -= previous[3]
+        self.disk[filename] = kind, key, iterations, size
+        self.disk_bytes += size
+
+    def save(self, filename, kind, key, iterations, dataset: MandelbrotData):
+        self.register(filename, kind, key, iterations, save_entry(filename, dataset))
+        self.remember(filename, replace(dataset, escapes=dataset.escapes.astype(ESCAPES_DTYPE)))  # as a reload from disk would read it
+        self.evict()
+        self.index_dirty = True
+
+    def remember(self, filename, dataset: MandelbrotData):
+        previous = self.ram.pop(filename, None)
+        if previous is not None:
+            self.ram_bytes -= dataset_nbytes(previous)
+        self.ram[filename] = dataset
+        self.ram_bytes += dataset_nbytes(dataset)
+        while self.ram_bytes > self.ram_budget and self.ram:
+            _, dropped = self.ram.popitem(last=False)
+            self.ram_bytes -= dataset_nbytes(dropped)
+
+    def evict(self):
+        """
+        Delete the least recently used files until the disk tier fits its budget, always keeping the latest one.
+        """
+        while self.disk_bytes > self.disk_budget and len(self.disk) > 1:
+            filename, (kind, key, iterations, size) = self.disk.popitem(last=False)
+            self.disk_bytes -= size
+            index = self.directory if kind == 'view' else self.tiles
+            index[key].pop(iterations, None)
+            if not index[key]:
+                del index[key]
+            dropped = self.ram.pop(filename, None)
+            if dropped is not None:
+                self.ram_bytes -= dataset_nbytes(dropped)
+            shutil.rmtree(filename, ignore_errors=True)
 
     def gen_filename(self, specs: PlotSpecs):
-        filename = f"{FILE_PREFIX}-{specs.iterations}-{specs.xmin}-{specs.xmax}-{specs.ymin}-{specs.ymax}.npz"
+        filename = f"{FILE_PREFIX}-{specs.iterations}-{specs.xmin}-{specs.xmax}-{specs.ymin}-{specs.ymax}"
         return os.path.join(self.cache_dir, filename)
 
     def cleanup(self):
-        filename_pattern = f"{FILE_PREFIX}-*.npz"
+        filename_pattern = f"{FILE_PREFIX}-*"
         files = glob.glob(os.path.join(self.cache_dir, filename_pattern))
         for filename in files:
-            os.remove(filename)
+            if os.path.isdir(filename):
+                shutil.rmtree(filename)
+        if os.path.exists(self.index_filename()):
+            os.remove(self.index_filename())
+        self.directory.clear()
+        self.tiles.clear()
+        self.ram.clear()
+        self.disk.clear()
+        self.ram_bytes = self.disk_bytes = 0
+        self.index_dirty = False
 
     def exists(self, specs: PlotSpecs) -> bool:
         key = specs.xmin, specs.xmax, specs.ymin, specs.ymax
         return key in self.directory and specs.iterations in self.directory[key]
 
     def commit(self, specs: PlotSpecs, dataset: MandelbrotData):
-        key = specs.xmin, specs.xmax, specs.ymin, specs.ymax
-        filename = self.gen_filename(specs)
-        np.savez(filename, escapes=dataset.escapes, interior=dataset.interior, specs=np.array(astuple(specs)), Z=dataset.Z)
-        self.directory[key][specs.iterations] = filename
+        key = float(specs.xmin), float(specs.xmax), float(specs.ymin), float(specs.ymax)
+        self.save(self.gen_filename(specs), 'view', key, specs.iterations, dataset)
 
     def get(self, specs: PlotSpecs) -> MandelbrotData:
         filename = self.gen_filename(specs)
         return self.load(filename)
 
+    def get_truncated(self, specs: PlotSpecs) -> MandelbrotData:
+        """
+        The view derived from the same view cached with more iterations, or None if there is none.
+        """
+        key = specs.xmin, specs.xmax, specs.ymin, specs.ymax
+        higher = higher_iterations(self.directory.get(key, {}), specs.iterations)
+        if higher is None:
+            return None
+        return truncate(self.load(self.directory[key][higher]), specs.iterations)
+
     def get_closest(self, specs: PlotSpecs) -> MandelbrotData:
         if self.exists(specs):
             return self.get(specs)
@@ -54,14 +167,144 @@ class CacheManager:
         filename = entries[iterations[index]]
         return self.load(filename)
 
-    def load(self, filename):
-        mandelbrot = np.load(filename)
-        dataset = mandelbrot['escapes']
-        interior = mandelbrot['interior']
-        rect = np.array(mandelbrot['specs'])
-        Z_payload = mandelbrot['Z']
-        # Apply custom colormap for exterior
-        return MandelbrotData(dataset, interior, rect, Z_payload)
+    def tile_filename(self, level, tx, ty, iterations):
+        filename = f"{FILE_PREFIX}-tile-{iterations}-{level}-{tx}-{ty}"
+        return os.path.join(self.cache_dir, filename)
+
+    def tile_exists(self, level, tx, ty, iterations) -> bool:
+        return iterations in self.tiles.get((level, tx, ty), {})
+
+    def commit_tile(self, level, tx, ty, dataset: MandelbrotData):
+        iterations = dataset.to_specs().iterations
+        self.save(self.tile_filename(level, tx, ty, iterations), 'tile', (level, tx, ty), iterations, dataset)
+
+    def get_tile(self, level, tx, ty, iterations) -> MandelbrotData:
+        """
+        The tile itself if cached, otherwise derived from the tile cached with more iterations,
+        otherwise derived from its four children one level down the quadtree:
+        every other lattice point of a child is a lattice point of the parent.
+        Returns None if none is cached.
+        """
+        if self.tile_exists(level, tx, ty, iterations):
+            return self.load(self.tiles[level, tx, ty][iterations])
+        higher = higher_iterations(self.tiles.get((level, tx, ty), {}), iterations)
+        if higher is not None:
+            return truncate(self.load(self.tiles[level, tx, ty][higher]), iterations)
+        children = [(level + 1, 2 * tx + a, 2 * ty + b) for b in (0, 1) for a in (0, 1)]
+        if not all(self.tile_exists(*child, iterations) for child in children):
+            return None
+        c00, c10, c01, c11 = (self.load(self.tiles[child][iterations], with_z=True) for child in children)
+
+        def merge(field):
+            blocks = [[getattr(c00, field), getattr(c10, field)], [getattr(c01, field), getattr(c11, field)]]
+            if any(block is None for row in blocks for block in row):
+                return None
+            return np.block(blocks)[::2, ::2]
+
+        specs = np.array(astuple(tile_specs(level, tx, ty, iterations)))
+        dataset = MandelbrotData(merge('escapes'), merge('interior'), specs, merge('Z'), c00.precision)
+        self.commit_tile(level, tx, ty, dataset)
+        return dataset
+
+    def closest_tile_iterations(self, level, tx, ty, iterations):
+        """
+        The highest number of iterations below the given one the tile is cached at, or None.
+        """
+        entries = sorted(self.tiles.get((level, tx, ty), {}).keys())
+        index = bisect(entries, iterations) - 1
+        return entries[index] if index >= 0 and entries[index] < iterations else None
+
+    def get_closest_tile(self, level, tx, ty, iterations) -> MandelbrotData:
+        closest = self.closest_tile_iterations(level, tx, ty, iterations)
+        if closest is None:
+            return None
+        return self.load(self.tiles[level, tx, ty][closest], with_z=True)
+
+    def load(self, filename, with_z=False):
+        if filename in self.disk:
+            self.disk.move_to_end(filename)
+        dataset = self.ram.get(filename)
+        if dataset is None:
+            dataset = load_entry(filename, with_z)
+        elif with_z and dataset.Z is None:
+            dataset = replace(dataset, Z=load_z(filename, dataset.interior))
+        else:
+            self.ram.move_to_end(filename)
+            return dataset
+        self.remember(filename, dataset)
+        return dataset
+
+
+def higher_iterations(entries: dict, iterations):
+    """
+    The lowest number of iterations above the given one among the cached entries, or None.
+    """
+    higher = [n for n in entries if n > iterations]
+    return min(higher) if higher else None
+
+
+def truncate(dataset: MandelbrotData, iterations) -> MandelbrotData:
+    """
+    The dataset as computed with fewer iterations: the pixels escaping after the given iterations are interior,
+    the others are unchanged. Interior pixels have no Z at that point, so Z is dropped.
+    """
+    late = dataset.escapes > iterations
+    escapes = np.where(late, 0, dataset.escapes)
+    interior = dataset.interior | late
+    specs = np.array(astuple(replace(PlotSpecs(*dataset.specs), iterations=iterations)))
+    return MandelbrotData(escapes, interior, specs, precision=dataset.precision)
+
+
+def encode(dataset: MandelbrotData) -> dict:
+    """
+    On-disk layout of a dataset: escapes narrowed to ESCAPES_DTYPE, the interior mask packed 8 pixels to a byte,
+    and Z only for the interior points, the only ones that can still be continued.
+    """
+    fields = dict(escapes=dataset.escapes.astype(ESCAPES_DTYPE), interior=np.packbits(dataset.interior, axis=None),
+                  shape=np.array(dataset.interior.shape), specs=dataset.specs)
+    if dataset.precision is not None:
+        fields['precision'] = np.array(dataset.precision)
+    if STORE_Z and dataset.Z is not None:
+        fields['Z'] = dataset.Z[dataset.interior]
+    return fields
+
+
+def save_entry(path, dataset: MandelbrotData):
+    """
+    Save the encoded fields of the dataset as .npy files in the directory path. Returns their total size in bytes.
+    """
+    os.makedirs(path, exist_ok=True)
+    size = 0
+    for name, array in encode(dataset).items():
+        filename = os.path.join(path, f'{name}.npy')
+        np.save(filename, array)
+        size += os.path.getsize(filename)
+    return size
+
+
+def load_entry(path, with_z=False) -> MandelbrotData:
+    shape = tuple(np.load(os.path.join(path, 'shape.npy')))
+    interior = np.unpackbits(np.load(os.path.join(path, 'interior.npy')), count=int(np.prod(shape))).astype(bool).reshape(shape)
+    escapes_file = os.path.join(path, 'escapes.npy')
+    escapes = np.load(escapes_file, mmap_mode='r' if os.path.getsize(escapes_file) >= MMAP_MIN_BYTES else None)  # paged in when touched
+    specs = np.load(os.path.join(path, 'specs.npy'))
+    precision_file = os.path.join(path, 'precision.npy')
+    precision = str(np.load(precision_file)) if os.path.exists(precision_file) else None
+    return MandelbrotData(escapes, interior, specs, load_z(path, interior) if with_z else None, precision)
+
+
+def load_z(path, interior):
+    filename = os.path.join(path, 'Z.npy')
+    if not os.path.exists(filename):
+        return None
+    live = np.load(filename, mmap_mode='r')
+    Z = np.zeros(interior.shape, dtype=live.dtype)
+    Z[interior] = live
+    return Z
+
+
+def dataset_nbytes(dataset: MandelbrotData):
+    return sum(a.nbytes for a in (dataset.escapes, dataset.interior, dataset.specs, dataset.Z) if a is not None)
 
 
 cache_manager: CacheManager = CacheManager()
@@ -69,3 +312,7 @@ cache_manager: CacheManager = CacheManager()
 
 def cache_cleanup():
     cache_manager.cleanup()
+
+
+def cache_flush():
+    cache_manager.save_index()
@@ -1,97 +1,536 @@
-from dataclasses import astuple
-from decimal import Decimal
-from multiprocessing import Pool, Event
+import os
+import time
+from dataclasses import astuple, replace
+from decimal import Decimal, localcontext
+from multiprocessing import Event
 
 import numpy as np
 
 from constructs.cache import cache_manager
-from constructs.decimal_complex import dcomplex_zeroes, dcomplex_add, dcomplex_sq, DComplex, dcomplex_abs
+from constructs.decimal_complex import dcomplex_zeroes, dcomplex_add, dcomplex_sq, DComplex, dcomplex_abs, DDComplex, DD_DIGITS, \
+    ddcomplex_zeroes, ddcomplex_offset, ddcomplex_split, ddcomplex_concat, dd_linspace
 from constructs.model import PlotSpecs, MandelbrotData
+from constructs.perturbation import view_center, orbit_digits, pixel_digits, reference_orbit, delta_grid, pick_reference, to_decimal
+from constructs.tiles import TILE_SIZE, tile_level, tiles_covering, tile_specs, lattice_pitch, lattice_index, lattice_exact
+from constructs.workers import render_pool, run_shared, report_utilization, utilization
 
-CPU_CORES = 8
+CPU_CORES = os.cpu_count() or 1
 PARALLELISM = CPU_CORES * 2
+TASK_PIXELS = 4096  # pixels per task handed out to the workers, so that costly parts of the frame get spread out
 THRESHOLD = 2
 complex_type = np.longcomplex
-ATOL = 1e-16
+ATOL = 1e-13
+COMPACT_RATIO = .25
+PERIOD_TOL = 1e-3  # cycle detection tolerance, relative to the pixel pitch
+PERIOD_CHECK = 8
+GLITCH_TOL = 1e-3
+MAX_REFERENCES = 16
+CANCEL_CHECK = 16  # iterations between two reads of the cancel flag
+SUBDIVIDE = True
+MIN_RECT = 8  # rectangles with a side shorter than this are computed in full
+PROGRESSIVE_STRIDES = (8, 4, 2, 1)
+PRECISION_TIERS = {'complex64': np.complex64, 'complex128': np.complex128, 'longdouble': np.clongdouble}
+TIER_MARGIN = 2 ** 10  # rounding error a tier may build up while iterating, in units of its epsilon
 
 
 def mandelbrot_calc_dcomplex(C: np.array, iterations, Z: np.array, cancel_event: Event):
+    """
+    Only the points still running are iterated: they are kept compacted together with their indices,
+    and every point escaping is written back to Z and dropped at once.
+    """
     mask_interior = np.full(C.shape, True, dtype=bool)  # mask for interior points
     diverging_order = np.zeros(C.shape)  # the number of iterations it takes to reach diverging point (> 2)
+    index = np.nonzero(mask_interior)  # indices of the active set
+    c, z = C[index], Z[index]
     for i in range(iterations):
-        if cancel_event is not None and cancel_event.is_set():
+        if cancel_event is not None and i % CANCEL_CHECK == 0 and cancel_event.is_set():
             break
-        Z[mask_interior] = dcomplex_add(dcomplex_sq(Z[mask_interior]), C[mask_interior])
-        norm = dcomplex_abs(Z)
-        diverged = norm > 2
-        mask = diverged & mask_interior
-        diverging_order[mask] = i + 1 - np.log(np.log2(np.array(norm[mask], dtype=np.float64)))
-        mask_interior[mask] = False
+        z = dcomplex_add(dcomplex_sq(z), c)
+        norm = dcomplex_abs(z)
+        mask = np.asarray(norm > 2, dtype=bool)
+        if not mask.any():
+            continue
+        escaped = tuple(axis[mask] for axis in index)
+        diverging_order[escaped] = i + 1 - np.log(np.log2(np.array(norm[mask], dtype=np.float64)))
+        mask_interior[escaped] = False
+        Z[escaped] = z[mask]
+        index, c, z = tuple(axis[~mask] for axis in index), c[~mask], z[~mask]
+    Z[index] = z
     return diverging_order, mask_interior, Z
 
 
-def mandelbrot_calc(C: np.array, iterations, Z: np.array, cancel_event: Event):
+def mandelbrot_calc(C: np.array, iterations, Z: np.array, cancel_event: Event, period_tol: float = None):
+    """
+    Only the points still running are iterated: they are kept in compacted flat arrays together with their indices.
+    Escaped points are scattered back into the results right away and parked at the fixed point z = c = 0
+    until the next compaction drops them, which happens once they make up COMPACT_RATIO of the active set.
+    The real and imaginary parts live in separate preallocated float arrays updated in place by ufuncs with out=,
+    so an iteration allocates nothing: the squares of the real and imaginary parts are shared between the update
+    and the escape test against THRESHOLD ** 2, and only the points escaping at that step are smoothed.
+
+    If period_tol is given, orbits are also checked for cycles Brent-style: z is saved at iterations 1, 2, 4, 8, ...
+    and every PERIOD_CHECK iterations a point coming back within period_tol of its saved value is periodic,
+    hence interior, and retired at once.
+    Returns the number of points retired that way along with the escapes, the interior mask and Z.
+    """
     mask_interior = np.full(C.shape, True, dtype=bool)  # mask for interior points
     diverging_order = np.zeros(C.shape)  # the number of iterations it takes to reach diverging point (> THRESHOLD)
+    Z = Z.copy()
+    index = np.arange(C.size)  # flat indices of the active set
+    cx, cy = C.real.ravel().copy(), C.imag.ravel().copy()
+    x, y = Z.real.ravel().copy(), Z.imag.ravel().copy()
+    saved_x, saved_y = x.copy(), y.copy()
+    x2, y2 = x * x, y * y
+    norm, delta, delta_y = np.empty_like(x), np.empty_like(x), np.empty_like(x)
+    mask, periodic = np.empty(x.shape, dtype=bool), np.empty(x.shape, dtype=bool)
+    bailout = THRESHOLD ** 2
+    next_save = 1
+    retired = np.zeros(C.size, dtype=bool)
+    n_retired = 0
+    periodic_count = 0
     for i in range(iterations):
+        if cancel_event is not None and i % CANCEL_CHECK == 0 and cancel_event.is_set():
+            break
+        # z = z ** 2 + c, from the squares of the previous step
+        np.multiply(x, y, out=y)
+        y *= 2
+        y += cy
+        np.subtract(x2, y2, out=x)
+        x += cx
+        np.multiply(x, x, out=x2)
+        np.multiply(y, y, out=y2)
+        np.add(x2, y2, out=norm)
+        np.greater(norm, bailout, out=mask)
+        escaping = mask.any()
+        if escaping:
+            hits = np.flatnonzero(mask)
+            escaped = index[hits]
+            diverging_order.flat[escaped] = i + 1 - np.log(np.log2(norm[hits].astype(np.float64)) / 2)
+            mask_interior.flat[escaped] = False
+        check = period_tol is not None and i % PERIOD_CHECK == 0
+        if check:
+            np.subtract(x, saved_x, out=delta)
+            np.subtract(y, saved_y, out=delta_y)
+            delta *= delta
+            delta_y *= delta_y
+            delta += delta_y
+            np.less(delta, period_tol ** 2, out=periodic)  # parked points have a NaN saved value and never match
+            periodic &= ~mask
+            if periodic.any():
+                periodic_count += np.count_nonzero(periodic)
+                mask |= periodic
+                hits = np.flatnonzero(mask)
+                escaping = True
+        if period_tol is not None and i + 1 == next_save:
+            saved_x[:], saved_y[:] = x, y
+            saved_x[retired] = np.nan
+            next_save *= 2
+        if not escaping:
+            continue
+        Z.flat[index[hits]] = x[hits] + 1j * y[hits]
+        for part in (x, y, cx, cy, x2, y2):
+            part[hits] = 0
+        saved_x[hits] = np.nan
+        retired[hits] = True
+        n_retired += hits.size
+        if n_retired >= COMPACT_RATIO * index.size:
+            active = ~retired
+            index, x, y, cx, cy, x2, y2, saved_x, saved_y = (part[active] for part in (index, x, y, cx, cy, x2, y2, saved_x, saved_y))
+            norm, delta, delta_y = np.empty_like(x), np.empty_like(x), np.empty_like(x)
+            mask, periodic = np.empty(x.shape, dtype=bool), np.empty(x.shape, dtype=bool)
+            retired = np.zeros(index.size, dtype=bool)
+            n_retired = 0
+    active = ~retired
+    Z.flat[index[active]] = x[active] + 1j * y[active]
+    return diverging_order, mask_interior, Z, periodic_count
+
+
+def mandelbrot_calc_subdivide(C: np.array, iterations, Z: np.array, cancel_event: Event, period_tol: float = None):
+    """
+    Mariani-Silver: compute the border of a rectangle, fill it as interior if the whole border is interior,
+    otherwise split it in four and recurse. The set is connected, so a rectangle bounded by interior points is interior.
+    Rectangles are processed level by level so that each level costs a single call to mandelbrot_calc.
+    Filled pixels are never iterated, their Z is left as NaN.
+    """
+    height, width = C.shape
+    mask_interior = np.full(C.shape, True, dtype=bool)  # mask for interior points
+    diverging_order = np.zeros(C.shape)  # the number of iterations it takes to reach diverging point (> THRESHOLD)
+    Z_out = np.full(C.shape, np.nan, dtype=Z.dtype)
+    done = np.zeros(C.shape, dtype=bool)
+    periodic_count = 0
+    rects = [(0, height - 1, 0, width - 1)]  # inclusive row and column bounds
+    while rects:
+        todo = np.zeros(C.shape, dtype=bool)
+        for y0, y1, x0, x1 in rects:
+            if y1 - y0 < MIN_RECT or x1 - x0 < MIN_RECT:
+                todo[y0:y1 + 1, x0:x1 + 1] = True
+            else:
+                todo[[y0, y1], x0:x1 + 1] = True
+                todo[y0:y1 + 1, [x0, x1]] = True
+        todo &= ~done
+        escapes, interior, Z_todo, periodic = mandelbrot_calc(C[todo], iterations, Z[todo], cancel_event, period_tol)
         if cancel_event is not None and cancel_event.is_set():
             break
-        Z[mask_interior] = Z[mask_interior] ** 2 + C[mask_interior]
+        diverging_order[todo], mask_interior[todo], Z_out[todo] = escapes, interior, Z_todo
+        done |= todo
+        periodic_count += periodic
+
+        next_rects = []
+        for y0, y1, x0, x1 in rects:
+            if y1 - y0 < MIN_RECT or x1 - x0 < MIN_RECT:
+                continue
+            border_interior = (mask_interior[[y0, y1], x0:x1 + 1].all() and mask_interior[y0:y1 + 1, [x0, x1]].all())
+            if border_interior:
+                done[y0:y1 + 1, x0:x1 + 1] = True
+                continue
+            ym, xm = (y0 + y1) // 2, (x0 + x1) // 2
+            next_rects += [(y0, ym, x0, xm), (y0, ym, xm, x1), (ym, y1, x0, xm), (ym, y1, xm, x1)]
+        rects = next_rects
+    return diverging_order, mask_interior, Z_out, periodic_count
+
+
+def mandelbrot_calc_perturb(dC: np.array, iterations, Zref: np.array, cancel_event: Event):
+    """
+    Iterate the float64 deltas dZ of every pixel against the reference orbit Zref:
+        dZ_{n+1} = (2 * Zref_n + dZ_n) * dZ_n + dC
+    A pixel is glitched when its full orbit Zref + dZ gets much smaller than the reference (Pauldelbrot's criterion)
+    or when it outlives the reference orbit. Glitched pixels stop iterating and have to be redone against another reference.
+    """
+    mask_interior = np.full(dC.shape, True, dtype=bool)  # mask for interior points
+    glitched = np.full(dC.shape, False, dtype=bool)
+    diverging_order = np.zeros(dC.shape)  # the number of iterations it takes to reach diverging point (> THRESHOLD)
+    dZ = np.zeros_like(dC)
+    Z = np.zeros_like(dC)
+    for i in range(iterations):
+        if cancel_event is not None and i % CANCEL_CHECK == 0 and cancel_event.is_set():
+            break
+        active = mask_interior & ~glitched
+        if i + 1 >= len(Zref):
+            glitched[active] = True
+            break
+        dZ[active] = (2 * Zref[i] + dZ[active]) * dZ[active] + dC[active]
+        Z[active] = Zref[i + 1] + dZ[active]
         norm = np.abs(Z)
-        diverged = norm > THRESHOLD
-        mask = diverged & mask_interior
-        diverging_order[mask] = i + 1 - np.log(np.log2(np.array(norm[mask], dtype=np.float64)))
+        mask = (norm > THRESHOLD) & active
+        diverging_order[mask] = i + 1 - np.log(np.log2(norm[mask]))
         mask_interior[mask] = False
-    return diverging_order, mask_interior, Z
+        glitched[active & ~mask & (norm < GLITCH_TOL * np.abs(Zref[i + 1]))] = True
+    return diverging_order, mask_interior, Z, glitched
 
 
-def clingrid(specs: PlotSpecs):
-    x = np.linspace(specs.xmin, specs.xmax, specs.width, dtype=complex_type)
-    y = np.linspace(specs.ymin, specs.ymax, specs.height, dtype=complex_type)
+def clingrid(specs: PlotSpecs, dtype=complex_type):
+    x = np.linspace(specs.xmin, specs.xmax, specs.width, dtype=dtype)
+    y = np.linspace(specs.ymin, specs.ymax, specs.height, dtype=dtype)
     C = x[np.newaxis, :] + 1j * y[:, np.newaxis]
     return C
 
 
+def use_perturbation(specs: PlotSpecs) -> bool:
+    """
+    Whether the view is too deep for the tile lattice: narrower than ATOL, or with lattice indices past what float64 holds exactly.
+    """
+    precision = min(specs.xmax - specs.xmin, specs.ymax - specs.ymin)
+    return bool(np.isclose(precision, 0, atol=ATOL)) or not lattice_exact(specs)
+
+
+def precision_tier(specs: PlotSpecs) -> str:
+    """
+    The cheapest precision resolving adjacent pixels of the view: the first of PRECISION_TIERS whose epsilon,
+    relative to the coordinates and times TIER_MARGIN, is below the pixel pitch.
+    Views deeper than ATOL are 'extended': perturbation, falling back to double-double or Decimal.
+    """
+    if use_perturbation(specs):
+        return 'extended'
+    pitch = min((specs.xmax - specs.xmin) / (specs.width - 1), (specs.ymax - specs.ymin) / (specs.height - 1))
+    magnitude = max(abs(specs.xmin), abs(specs.xmax), abs(specs.ymin), abs(specs.ymax), 1)
+    for tier, dtype in PRECISION_TIERS.items():
+        if np.finfo(dtype).eps * magnitude * TIER_MARGIN <= pitch:
+            return tier
+    return 'longdouble'
+
+
+def widest_tier(tiers) -> str:
+    order = [*PRECISION_TIERS, 'extended']
+    return max(tiers, key=order.index)
+
+
 def data_gen(specs: PlotSpecs, regen=False, cancel_event: Event = None) -> MandelbrotData:
     """
-    If Z is none, calculate the mandelbrot dataset ab initio
-    Otherwise, calculate the mandelbrot dataset based on the given Z with additional iterations given by iterations_delta.
+    Views above ATOL are assembled from the tile cache, computing only the tiles that are missing.
+    Deep zooms are computed and cached as whole viewports.
+    Either is derived from the same tiles or viewport cached with more iterations when there is one.
+    Once cancelled, returns what got computed so far marked incomplete, which is never cached.
     """
+    if not use_perturbation(specs):
+        return tile_gen(specs, regen, cancel_event)
+    if not regen and not cache_manager.exists(specs):
+        dataset = cache_manager.get_truncated(specs)
+        if dataset is not None:
+            return dataset
     if regen or not cache_manager.exists(specs):
         print(f"Generating data for:\n  PlotSpecs{astuple(specs)}")
-        dataset = data_regen(specs, cancel_event)
-        if dataset is None:
-            return None
+        dataset = perturbation_regen(specs, cancel_event)
+        if not dataset.complete:
+            return dataset
         cache_manager.commit(specs, dataset)
+        cache_manager.save_index()
     return cache_manager.get(specs)
 
 
-def data_regen(specs, cancel_event: Event):
-    precision = min(specs.xmax - specs.xmin, specs.ymax - specs.ymin)
-    use_dcomplex = np.isclose(precision, 0, atol=ATOL)
-
-    C = dclingrid(specs) if use_dcomplex else clingrid(specs)
-    closest_dataset = cache_manager.get_closest(specs)
-    if closest_dataset is None:
-        Z = dcomplex_zeroes(C.shape) if use_dcomplex else np.zeros_like(C, dtype=complex_type)
-        iterations_payload = 0
-    else:
-        Z = closest_dataset.Z
-        iterations_payload = closest_dataset.to_specs().iterations
-    C_chunks = np.array_split(C, PARALLELISM, axis=0)
-    Z_chunks = np.array_split(Z, PARALLELISM, axis=0)
-    with Pool(processes=CPU_CORES) as pool:
-        results = pool.starmap_async(mandelbrot_calc_dcomplex if use_dcomplex else mandelbrot_calc,
-                                     [(c, (specs.iterations - iterations_payload), z, cancel_event) for c, z in zip(C_chunks, Z_chunks)])
-        # Merge back along rows
-        diverging_order_chunks, mask_interior_chunks, Z_chunks = zip(*results.get())
-    if cancel_event is not None and cancel_event.is_set():
-        return None
-    diverging_order = np.vstack(diverging_order_chunks) + iterations_payload
-    mask_interior = np.vstack(mask_interior_chunks)
-    Z = np.vstack(Z_chunks)
-    dataset = MandelbrotData(diverging_order, mask_interior, np.array(astuple(specs)), Z)
-    return dataset
+def data_gen_progressive(specs: PlotSpecs, regen=False, cancel_event: Event = None):
+    """
+    Yield the mandelbrot dataset at increasing resolutions, one for each stride in PROGRESSIVE_STRIDES.
+    Missing tiles are computed in passes: the pass at stride s computes the lattice points whose indices are multiples of s
+    that the coarser passes have not, so every pass can be shown sampled every s pixels,
+    and the last pass completes the tiles at the cost of a single render.
+    The passes run mandelbrot_calc and not the subdivision kernel of tiles_regen: its rectangles need whole borders,
+    which the strided passes do not compute, and with periodicity checks retiring interior points early
+    each of its levels costs a restart of the iteration loop for the boundary points rather than saving work.
+    Deep zooms and continuations are yielded once, as data_gen would return them.
+    Once cancelled, the last pass is yielded again marked incomplete, and only the tiles completed so far get cached,
+    so that rendering the view again resumes from them.
+    """
+    if use_perturbation(specs):
+        yield data_gen(specs, regen, cancel_event)
+        return
+    level = tile_level(specs)
+    keys = tiles_covering(specs, level)
+    tiles = {} if regen else {key: cache_manager.get_tile(level, *key, specs.iterations) for key in keys}
+    missing = [key for key in keys if tiles.get(key) is None]
+    if any(cache_manager.closest_tile_iterations(level, *key, specs.iterations) is not None for key in missing):
+        yield tile_gen(specs, regen, cancel_event)
+        return
+
+    if missing:
+        print(f"Generating {len(missing)} of {len(keys)} tile(s) progressively for:\n  PlotSpecs{astuple(specs)}")
+        tier = widest_tier(precision_tier(tile_specs(level, *key, specs.iterations)) for key in missing)
+        C = np.stack([clingrid(tile_specs(level, *key, specs.iterations), PRECISION_TIERS[tier]) for key in missing])
+        diverging_order = np.zeros(C.shape)
+        mask_interior = np.full(C.shape, True, dtype=bool)
+        Z = np.zeros_like(C)
+        done = np.zeros(C.shape, dtype=bool)
+        period_tol = PERIOD_TOL * lattice_pitch(level)
+        pool = render_pool(CPU_CORES)
+        partial = None
+        timings, start_time = [], time.perf_counter()
+        for stride in PROGRESSIVE_STRIDES:
+            todo = np.zeros(C.shape, dtype=bool)
+            todo[:, ::stride, ::stride] = True
+            todo &= ~done
+            escapes, interior, Z_todo, finished = calc_pixels(pool, C[todo], Z[todo], specs.iterations, cancel_event, period_tol, timings)
+            computed = np.zeros(C.shape, dtype=bool)
+            computed[todo] = finished
+            diverging_order[computed], mask_interior[computed], Z[computed] = escapes[finished], interior[finished], Z_todo[finished]
+            done |= computed
+            if not finished.all():
+                break
+            if stride > 1:
+                passed = {key: MandelbrotData(diverging_order[n], mask_interior[n], None, Z[n]) for n, key in enumerate(missing)}
+                partial = assemble(specs, level, {**tiles, **passed}, stride)
+                yield partial
+        for n, key in enumerate(missing):
+            if done[n].all():
+                tiles[key] = MandelbrotData(diverging_order[n], mask_interior[n], np.array(astuple(tile_specs(level, *key, specs.iterations))), Z[n], tier)
+                cache_manager.commit_tile(level, *key, tiles[key])
+        cache_manager.save_index()
+        if done.all():
+            report_utilization(utilization(timings, time.perf_counter() - start_time))
+        else:
+            if partial is not None:
+                yield replace(partial, complete=False)
+            return
+    yield assemble(specs, level, tiles)
+
+
+def calc_pixels(pool, C: np.array, Z: np.array, iterations, cancel_event: Event, period_tol: float = None, timings: list = None):
+    """
+    Run mandelbrot_calc over the flat arrays C and Z split across the pool in tasks of about TASK_PIXELS points,
+    adding the timings of the tasks to timings when given, see run_shared.
+    Returns the escapes, interior mask and Z of the points, and whether each point got computed:
+    once cancelled, only the points of the tasks that completed are.
+    """
+    chunks = max(PARALLELISM, -(-C.size // TASK_PIXELS))
+    parts = [(mandelbrot_calc, c, z, iterations) for c, z in zip(np.array_split(C, chunks), np.array_split(Z, chunks))]
+    escapes, interior, Z, _, complete = run_shared(pool, parts, cancel_event, period_tol, timings)
+    return escapes, interior, Z, np.repeat(complete, [c.size for _, c, _, _ in parts])
+
+
+def data_regen(specs, cancel_event: Event, commit=True):
+    """
+    Calculate the mandelbrot dataset ignoring whatever is cached for it. Without commit, the tiles computed are not cached either.
+    """
+    if use_perturbation(specs):
+        return perturbation_regen(specs, cancel_event)
+    return tile_gen(specs, True, cancel_event, commit)
+
+
+def tile_gen(specs: PlotSpecs, regen=False, cancel_event: Event = None, commit=True) -> MandelbrotData:
+    level = tile_level(specs)
+    keys = tiles_covering(specs, level)
+    tiles = {} if regen else {key: cache_manager.get_tile(level, *key, specs.iterations) for key in keys}
+    missing = [key for key in keys if tiles.get(key) is None]
+    if missing:
+        print(f"Generating {len(missing)} of {len(keys)} tile(s) for:\n  PlotSpecs{astuple(specs)}")
+        computed = tiles_regen(level, missing, specs.iterations, cancel_event)
+        for key, tile in zip(missing, computed):
+            if tile is not None:
+                if commit:
+                    cache_manager.commit_tile(level, *key, tile)
+                tiles[key] = tile
+        cache_manager.save_index()
+        if any(tile is None for tile in computed):
+            return replace(assemble(specs, level, tiles), complete=False)
+    return assemble(specs, level, tiles)
+
+
+def tiles_regen(level, keys, iterations, cancel_event: Event):
+    """
+    Compute the given tiles of a level, one task per tile across the pool.
+    Tiles cached with fewer iterations are continued: only their pixels still bounded are iterated further from their Z,
+    and the pixels filled by subdivision, which have no Z, are computed from scratch. The other tiles are computed from scratch.
+    Every tile is computed in its own precision_tier.
+    Returns the tile datasets, None for the tiles left incomplete by a cancellation.
+    """
+    period_tol = PERIOD_TOL * lattice_pitch(level)
+    parts, continued, tiers = [], [], []
+    for key in keys:
+        tiers.append(precision_tier(tile_specs(level, *key, iterations)))
+        C = clingrid(tile_specs(level, *key, iterations), PRECISION_TIERS[tiers[-1]])
+        closest_dataset = cache_manager.get_closest_tile(level, *key, iterations)
+        if closest_dataset is None or closest_dataset.Z is None:
+            # Subdivision can only start from scratch: filled pixels are never iterated, so there is no Z to resume from
+            kernel = mandelbrot_calc_subdivide if SUBDIVIDE else mandelbrot_calc
+            parts.append((kernel, C, np.zeros_like(C), iterations))
+            continued.append(None)
+        else:
+            live, filled = live_pixels(closest_dataset)
+            iterations_payload = closest_dataset.to_specs().iterations
+            parts.append((mandelbrot_calc, C[live], closest_dataset.Z[live].astype(C.dtype), iterations - iterations_payload))
+            parts.append((mandelbrot_calc, C[filled], np.zeros_like(C[filled]), iterations))
+            continued.append(closest_dataset)
+    diverging_order, mask_interior, Z, periodic_counts, complete = run_shared(render_pool(CPU_CORES), parts, cancel_event, period_tol)
+    finished = iter(complete)
+    print(f"Periodicity: {sum(periodic_counts)} interior pixel(s) retired early")
+    bounds = np.cumsum([C.size for _, C, _, _ in parts]).tolist()
+    outputs = iter(zip(np.split(diverging_order, bounds[:-1]), np.split(mask_interior, bounds[:-1]), np.split(Z, bounds[:-1])))
+    tiles = []
+    for key, closest_dataset, tier in zip(keys, continued, tiers):
+        specs = np.array(astuple(tile_specs(level, *key, iterations)))
+        if closest_dataset is None:
+            escapes, interior, Z_tile = (output.reshape(TILE_SIZE, TILE_SIZE) for output in next(outputs))
+            tile = MandelbrotData(escapes, interior, specs, Z_tile.astype(PRECISION_TIERS[tier]), tier)
+            tiles.append(tile if next(finished) else None)
+        else:
+            tile = merge_continued(closest_dataset, next(outputs), next(outputs), specs, tier)
+            tiles.append(tile if next(finished) & next(finished) else None)
+    return tiles
+
+
+def live_pixels(dataset: MandelbrotData):
+    """
+    Split the interior pixels of the dataset into the live ones, still bounded with a finite Z when its iterations ran out,
+    and the ones filled by subdivision, which were never iterated. Escaped pixels are final.
+    """
+    finite = np.isfinite(dataset.Z)
+    return dataset.interior & finite, dataset.interior & ~finite
+
+
+def merge_continued(dataset: MandelbrotData, live_results, filled_results, specs: np.ndarray, tier: str) -> MandelbrotData:
+    """
+    Merge the results of iterating the live pixels of dataset further, and of computing its filled pixels, into a copy of it.
+    Only the live pixels escaping in the continuation get the iterations of dataset added to their escape counts.
+    """
+    live, filled = live_pixels(dataset)
+    iterations_payload = dataset.to_specs().iterations
+    escapes = np.array(dataset.escapes, dtype=np.float64)
+    interior = dataset.interior.copy()
+    Z = dataset.Z.astype(PRECISION_TIERS[tier])
+    diverging_order, mask_interior, Z[live] = live_results
+    escapes[live] = np.where(mask_interior, 0, diverging_order + iterations_payload)
+    interior[live] = mask_interior
+    escapes[filled], interior[filled], Z[filled] = filled_results
+    return MandelbrotData(escapes, interior, specs, Z, tier)
+
+
+def assemble(specs: PlotSpecs, level, tiles: dict, stride=1) -> MandelbrotData:
+    """
+    Sample the view, every stride pixels, from the nearest lattice points of the tiles. Tiles that are None are left blank.
+    """
+    tx, lx, ty, ly = lattice_index(specs, level, stride)
+    diverging_order = np.zeros((ty.size, tx.size))
+    mask_interior = np.full((ty.size, tx.size), True, dtype=bool)
+    Z = np.zeros((ty.size, tx.size), dtype=complex_type)
+    for (kx, ky), tile in tiles.items():
+        if tile is None:
+            continue
+        rows, cols = np.flatnonzero(ty == ky), np.flatnonzero(tx == kx)
+        view, source = np.ix_(rows, cols), np.ix_(ly[rows], lx[cols])
+        diverging_order[view], mask_interior[view] = tile.escapes[source], tile.interior[source]
+        if tile.Z is not None:
+            Z[view] = tile.Z[source]
+    view_specs = PlotSpecs(specs.xmin, specs.xmax, specs.ymin, specs.ymax, specs.iterations, tx.size, ty.size)
+    tiers = [tile.precision for tile in tiles.values() if tile is not None and tile.precision is not None]
+    return MandelbrotData(diverging_order, mask_interior, np.array(astuple(view_specs)), Z, widest_tier(tiers) if tiers else None)
+
+
+def perturbation_regen(specs, cancel_event: Event):
+    """
+    Deep zoom: one reference orbit in arbitrary precision, every pixel iterated as a float64 delta from it.
+    Glitched pixels are redone against a new reference picked among them, up to MAX_REFERENCES times.
+    Whatever is still glitched after that falls back to the extended precision kernel.
+    Once cancelled, the pixels of the passes completed so far are returned, marked incomplete.
+    """
+    digits = orbit_digits(specs)
+    cx, cy = view_center(specs)
+    dC = delta_grid(specs, cx, cy)
+    diverging_order = np.zeros(dC.shape)
+    mask_interior = np.full(dC.shape, True, dtype=bool)
+    Z = np.zeros(dC.shape, dtype=np.complex128)
+    pending = np.full(dC.shape, True, dtype=bool)
+    references = 0
+    pool = render_pool(CPU_CORES)
+    while pending.any() and references < MAX_REFERENCES:
+        if references > 0:
+            offset = pick_reference(dC, pending)
+            dC = dC - offset
+            with localcontext() as ctx:
+                ctx.prec = digits
+                cx, cy = cx + Decimal(offset.real), cy + Decimal(offset.imag)
+        Zref = reference_orbit(cx, cy, specs.iterations, THRESHOLD, digits, cancel_event)
+        if cancel_event is not None and cancel_event.is_set():
+            return MandelbrotData(diverging_order, mask_interior, np.array(astuple(specs)), Z, 'extended', complete=False)
+        references += 1
+        dC_chunks = np.array_split(dC[pending], PARALLELISM)
+        results = pool.starmap_async(mandelbrot_calc_perturb, [(dc, specs.iterations, Zref, cancel_event) for dc in dC_chunks])
+        diverging_order_chunks, mask_interior_chunks, Z_chunks, glitched_chunks = zip(*results.get())
+        if cancel_event is not None and cancel_event.is_set():
+            return MandelbrotData(diverging_order, mask_interior, np.array(astuple(specs)), Z, 'extended', complete=False)
+        diverging_order[pending] = np.concatenate(diverging_order_chunks)
+        mask_interior[pending] = np.concatenate(mask_interior_chunks)
+        Z[pending] = np.concatenate(Z_chunks)
+        pending[pending] = np.concatenate(glitched_chunks)
+    print(f"Perturbation: {references} reference orbit(s), {np.count_nonzero(pending)} glitched pixel(s) left")
+    if pending.any():
+        with localcontext() as ctx:
+            ctx.prec = digits
+            if pixel_digits(specs) <= DD_DIGITS:
+                # double-double needs no decimal context, so its chunks can run across the pool
+                chunks = ddcomplex_split(ddcomplex_offset(cx, cy, dC[pending]), min(PARALLELISM, np.count_nonzero(pending)))
+                results = pool.starmap_async(mandelbrot_calc_dcomplex, [(c, specs.iterations, ddcomplex_zeroes(c.shape), cancel_event) for c in chunks])
+                order_chunks, interior_chunks, Z_chunks = zip(*results.get())
+                order, interior, Z_left = np.concatenate(order_chunks), np.concatenate(interior_chunks), ddcomplex_concat(Z_chunks)
+            else:
+                C = np.array([DComplex(cx + Decimal(dc.real), cy + Decimal(dc.imag)) for dc in dC[pending]], dtype=object)
+                order, interior, Z_left = mandelbrot_calc_dcomplex(C, specs.iterations, dcomplex_zeroes(C.shape), cancel_event)
+        if cancel_event is not None and cancel_event.is_set():
+            return MandelbrotData(diverging_order, mask_interior, np.array(astuple(specs)), Z, 'extended', complete=False)
+        diverging_order[pending] = order
+        mask_interior[pending] = interior
+        if isinstance(Z_left, DDComplex):
+            Z[pending] = Z_left.to_complex()
+        else:
+            Z[pending] = [complex(float(z.real), float(z.imag)) for z in Z_left]
+    return MandelbrotData(diverging_order, mask_interior, np.array(astuple(specs)), Z, 'extended')
 
 
 def dclingrid(specs: PlotSpecs):
@@ -106,3 +545,11 @@ def dclingrid(specs: PlotSpecs):
         for i in range(specs.width):
             C[j, i] = DComplex(real=x[i], imag=y[j])
     return C
+
+
+def ddclingrid(specs: PlotSpecs) -> DDComplex:
+    shape = (specs.height, specs.width)
+    x_hi, x_lo = dd_linspace(to_decimal(specs.xmin), to_decimal(specs.xmax), specs.width)
+    y_hi, y_lo = dd_linspace(to_decimal(specs.ymin), to_decimal(specs.ymax), specs.height)
+    return DDComplex(*(np.broadcast_to(p[np.newaxis, :], shape).copy() for p in (x_hi, x_lo)),
+                     *(np.broadcast_to(p[:, np.newaxis], shape).copy() for p in (y_hi, y_lo)))
@@ -1,30 +1,48 @@
+import queue
 import threading
+import time
+import traceback
 from multiprocessing import Event
 
-from constructs.calc import data_gen
+from matplotlib import pyplot as plt
+from matplotlib.backend_bases import key_press_handler
+
+from constructs.calc import data_gen, data_gen_progressive, use_perturbation
 from constructs.history import HistoryCtrl
 from constructs.model import PlotHandle, PlotSpecs
-from constructs.viz import mandelbrot_viz
+from constructs.palette import PALETTES
+from constructs.prefetch import prefetch_candidates, view_keys, covered, is_cached, zoom_specs
+from constructs.tiles import lattice_pitch, tile_level
+from constructs.viz import mandelbrot_viz, recolor
 
 DEBOUNCE_TIME = .1
-MIN_ZOOM_LEVEL = 1e-14
+MIN_ZOOM_LEVEL = 1e-15
+POLL_INTERVAL = 50  # milliseconds between deliveries of finished passes to the GUI thread
+PREFETCH_REPORT = 20  # requests between two prints of the prefetch hit rate
 
 
 class MandelbrotCtrl:
-    def __init__(self, plot_handle: PlotHandle, zoom_factor=0.5, history_handle: HistoryCtrl = None, regen=False, cancel_event: Event = None):
+    def __init__(self, plot_handle: PlotHandle, zoom_factor=0.5, history_handle: HistoryCtrl = None, regen=False, cancel_event: Event = None,
+                 prefetch=True):
         self.handle = plot_handle
         self.zoom_factor = zoom_factor
         self.cid = self.handle.fig.canvas.mpl_connect('button_press_event', self.on_click)
         self.sid = self.handle.fig.canvas.mpl_connect('scroll_event', self.on_scroll)
+        self.mid = self.handle.fig.canvas.mpl_connect('motion_notify_event', self.on_motion)
 
         self.history_handle = history_handle
         if self.history_handle is not None:
+            self.history_handle.renderer = self.request
             self.handle.btn_undo.on_clicked(self.history_handle.undo)
             self.handle.btn_reset.on_clicked(self.history_handle.reset)
             self.handle.btn_redo.on_clicked(self.history_handle.redo)
 
-        # Connect the key press event
+        # Connect the key press event; 'p' cycles the palettes, so matplotlib's own key bindings go through default_keys
         self.kid = self.handle.fig.canvas.mpl_connect('key_press_event', self.on_key)
+        manager = self.handle.fig.canvas.manager
+        if manager is not None and manager.key_press_handler_id is not None:
+            self.handle.fig.canvas.mpl_disconnect(manager.key_press_handler_id)
+            manager.key_press_handler_id = self.handle.fig.canvas.mpl_connect('key_press_event', self.default_keys)
 
         self.handle.iter_box.on_submit(self._on_iteration_change)
 
@@ -34,6 +52,166 @@ class MandelbrotCtrl:
         self.scroll_accumulator = 0
         self.regen = regen
         self.cancel_event: Event = cancel_event
+        self.data = None  # dataset on screen, recolored without recompute when the palette changes
+
+        # Render queue: the GUI thread posts requests, a render thread computes them and posts the passes back.
+        # Every request gets a new generation; passes of older generations are dropped.
+        self.generation = 0
+        self.pending = None
+        self.on_done = None
+        self.render_cond = threading.Condition()
+        self.render_thread = None
+        self.results = queue.Queue()
+        self.cancel_latencies = []  # seconds from setting the cancel flag to the pool going idle
+
+        # Prefetch: while idle, the render thread computes the likely next views into the cache.
+        # It needs the cancel flag to give way to the next request, and only starts once the view on screen is complete.
+        # With regen every request recomputes regardless of the cache, so there is nothing to prefetch.
+        self.prefetch = prefetch and cancel_event is not None and not regen
+        self.cursor = None  # last position of the mouse in data coordinates
+        self.view = None  # specs of the view on screen once its render is complete
+        self.prefetched = {}  # cache keys computed by the prefetch, with their iterations, see constructs.prefetch.view_keys
+        self.prefetch_requests = 0
+        self.prefetch_hits = 0
+        self.poll_timer = self.handle.fig.canvas.new_timer(interval=POLL_INTERVAL)
+        self.poll_timer.add_callback(self.deliver)
+        self.poll_timer.start()
+
+    def request(self, specs: PlotSpecs, on_done=None, render=True):
+        """
+        Queue a render of specs without blocking the GUI thread. It supersedes the request still pending, if any,
+        and cancels the one in flight. on_done(specs) is called on the GUI thread once the render is complete.
+        Without render, specs is already on screen, e.g. a frame kept by the history: only the older requests are dropped.
+        """
+        if self.prefetch and render:
+            self.count_prefetch_hit(specs)
+        with self.render_cond:
+            self.generation += 1
+            self.pending = (self.generation, specs) if render else None
+            self.on_done = (specs, on_done)
+            self.view = None if render else specs
+            if self.cancel_event is not None:
+                self.cancel_event.set()
+            self.render_cond.notify()
+            if self.render_thread is None:
+                self.render_thread = threading.Thread(target=self.render_loop, name='render', daemon=True)
+                self.render_thread.start()
+        if not render:
+            self.data = None  # the dataset of the frame is not loaded, the palette cycle renders it again
+            if on_done is not None:
+                on_done(specs)
+
+    def render_loop(self):
+        """
+        Render thread: take the latest request and post every pass of its progressive render,
+        until a newer request supersedes it. A cancelled render posts what it got done, marked incomplete.
+        With no request pending, prefetch the next candidate view instead, see prefetch_next.
+        """
+        while True:
+            with self.render_cond:
+                prefetch_specs = None
+                while self.pending is None and prefetch_specs is None:
+                    prefetch_specs = self.prefetch_next()
+                    if prefetch_specs is None:
+                        self.render_cond.wait()
+                if self.pending is not None:
+                    (generation, specs), prefetch_specs = self.pending, None
+                    self.pending = None
+                if self.cancel_event is not None:
+                    self.cancel_event.clear()
+            if prefetch_specs is not None:
+                self.run_prefetch(prefetch_specs)
+                continue
+            try:
+                new_data = None
+                for new_data in data_gen_progressive(specs, regen=self.regen, cancel_event=self.cancel_event):
+                    if generation != self.generation:
+                        break
+                    self.results.put((generation, new_data, False))
+                else:
+                    if new_data is not None and new_data.complete:
+                        self.results.put((generation, None, True))
+                        with self.render_cond:
+                            if generation == self.generation:
+                                self.view = specs
+                if self.cancel_event is not None and self.cancel_event.is_set():
+                    self.report_cancel()
+            except Exception:
+                traceback.print_exc()
+
+    def prefetch_next(self):
+        """
+        The most likely next view, see constructs.prefetch.prefetch_candidates, that is neither prefetched nor cached yet.
+        None while the view on screen is not complete or when there is nothing left to prefetch.
+        """
+        if not self.prefetch or self.view is None:
+            return None
+        history, index = [], 0
+        if self.history_handle is not None:
+            history, index = self.history_handle.history, self.history_handle.index
+        for specs in prefetch_candidates(self.view, self.cursor, self.zoom_factor, history, index):
+            if min(specs.xmax - specs.xmin, specs.ymax - specs.ymin) < MIN_ZOOM_LEVEL:
+                continue
+            if not covered(view_keys(specs), self.prefetched) and not is_cached(specs):
+                return specs
+        return None
+
+    def run_prefetch(self, specs: PlotSpecs):
+        """
+        Render thread: compute specs into the cache. A request cancels it, so it never holds up the foreground.
+        """
+        try:
+            new_data = data_gen(specs, cancel_event=self.cancel_event)
+            if new_data.complete:
+                self.prefetched.update(view_keys(specs))
+        except Exception:
+            traceback.print_exc()
+            print("Prefetch: disabled")
+            self.prefetch = False  # rather than retrying the same candidate forever
+
+    def count_prefetch_hit(self, specs: PlotSpecs):
+        self.prefetch_requests += 1
+        if covered(view_keys(specs), self.prefetched):
+            self.prefetch_hits += 1
+        if self.prefetch_requests % PREFETCH_REPORT == 0:
+            print(f"Prefetch: hit rate {self.prefetch_hits}/{self.prefetch_requests} ({self.prefetch_hits / self.prefetch_requests:.0%})")
+
+    def report_cancel(self):
+        set_time = getattr(self.cancel_event, 'set_time', None)
+        if set_time is None:
+            return
+        self.cancel_latencies.append(time.perf_counter() - set_time)
+        print(f"Cancelled: idle {self.cancel_latencies[-1] * 1000:.0f} ms after the cancel, "
+              f"median {sorted(self.cancel_latencies)[len(self.cancel_latencies) // 2] * 1000:.0f} ms")
+
+    def deliver(self):
+        """
+        GUI thread: show the newest pass of the latest request, dropping whatever older requests posted.
+        """
+        latest, done = None, False
+        while True:
+            try:
+                generation, new_data, finished = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self.generation:
+                continue
+            latest = new_data if new_data is not None else latest
+            done |= finished
+        if latest is not None:
+            mandelbrot_viz(latest, self.handle)
+            self.data = latest
+        if done:
+            specs, on_done = self.on_done
+            if self.history_handle is not None:
+                self.history_handle.remember_frame(specs)
+            if on_done is not None:
+                on_done(specs)
+
+    def default_keys(self, event):
+        # matplotlib's key bindings of this figure, without 'p' toggling the pan tool
+        with plt.rc_context({'keymap.pan': [key for key in plt.rcParams['keymap.pan'] if key != 'p']}):
+            key_press_handler(event)
 
     # Define the key press event handler
     def on_key(self, event):
@@ -46,35 +224,52 @@ class MandelbrotCtrl:
             self.history_handle.redo(None)
         elif event.key == 'cmd+r':
             self.history_handle.reset(None)
+        elif event.key == 'p':  # press 'p' to cycle through the palettes
+            palette = PALETTES[(PALETTES.index(self.handle.palette) + 1) % len(PALETTES)]
+            print(f"Palette: {palette}")
+            if self.data is not None:
+                recolor(self.data, self.handle, palette)
+            else:
+                self.handle.palette = palette
+                if self.view is not None:
+                    self.request(self.view)
         elif event.key == 'cmd+c' or event.key == 'ctrl+c':
             if self.cancel_event is not None:
                 self.cancel_event.set()
 
+    def on_motion(self, event):
+        if event.inaxes != self.handle.ax or event.xdata is None:
+            return
+        self.cursor = (event.xdata, event.ydata)
+        if self.prefetch:
+            with self.render_cond:
+                self.render_cond.notify()  # the candidates around the cursor changed
+
     def on_click(self, event):
         if event.inaxes != self.handle.ax or event.button != 1:
             return  # Only respond to left-clicks inside the plot
-        if self.cancel_event is not None:
-            self.cancel_event.clear()
-        x, y = event.xdata, event.ydata
-        print(f"Recentering at: ({x:.3f}, {y:.3f})")
-
         # Current window size
         x0, x1 = self.handle.ax.get_xlim()
         y0, y1 = self.handle.ax.get_ylim()
-        dx = (x1 - x0) / 2
-        dy = (y1 - y0) / 2
+        specs = PlotSpecs(x0, x1, y0, y1, self.handle.iterations)
+
+        # Shift by whole lattice pitches, so that the overlap with the current view shows the same lattice points;
+        # deep views have no lattice and shift by whole pixels
+        if use_perturbation(specs):
+            px, py = (x1 - x0) / (specs.width - 1), (y1 - y0) / (specs.height - 1)
+        else:
+            px = py = lattice_pitch(tile_level(specs))
+        kx = round((event.xdata - (x0 + x1) / 2) / px)
+        ky = round((event.ydata - (y0 + y1) / 2) / py)
+        print(f"Recentering at: ({(x0 + x1) / 2 + kx * px:.3f}, {(y0 + y1) / 2 + ky * py:.3f})")
 
         # Set new limits centered on click
-        specs = PlotSpecs(x - dx, x + dx, y - dy, y + dy, self.handle.iterations)
+        specs = PlotSpecs(x0 + kx * px, x1 + kx * px, y0 + ky * py, y1 + ky * py, self.handle.iterations)
         self.handle.ax.set_xlim(specs.xmin, specs.xmax)
         self.handle.ax.set_ylim(specs.ymin, specs.ymax)
         self.handle.fig.canvas.draw_idle()
 
-        new_data = data_gen(specs, regen=self.regen, cancel_event=self.cancel_event)
-        if new_data is not None:
-            mandelbrot_viz(new_data, self.handle)
-            if self.history_handle is not None:
-                self.history_handle.append(specs)
+        self.request(specs, self.history_handle.append if self.history_handle is not None else None)
 
     def on_scroll(self, event):
         if event.inaxes != self.handle.ax:
@@ -98,9 +293,6 @@ class MandelbrotCtrl:
         if not steps:
             return
 
-        if self.cancel_event is not None:
-            self.cancel_event.clear()
-
         ax = event.inaxes
         xlim = ax.get_xlim()
         ylim = ax.get_ylim()
@@ -109,23 +301,17 @@ class MandelbrotCtrl:
         ydata = event.ydata
 
         scale_factor = self.zoom_factor ** steps
-        new_width = (xlim[1] - xlim[0]) * scale_factor
-        new_height = (ylim[1] - ylim[0]) * scale_factor
-        if min(new_width, new_height) < MIN_ZOOM_LEVEL:
-            print(f'Zoom level is already the lowest {MIN_ZOOM_LEVEL:.3f}')
+        specs = zoom_specs(PlotSpecs(*xlim, *ylim, self.handle.iterations), xdata, ydata, scale_factor)
+        if min(specs.xmax - specs.xmin, specs.ymax - specs.ymin) < MIN_ZOOM_LEVEL:
+            print(f'Zoom level is already the lowest {MIN_ZOOM_LEVEL:.1e}')
             return
 
-        specs = PlotSpecs(xdata - new_width / 2, xdata + new_width / 2, ydata - new_height / 2, ydata + new_height / 2)
         self.handle.update_iter_box(specs.iterations)
         ax.set_xlim(specs.xmin, specs.xmax)
         ax.set_ylim(specs.ymin, specs.ymax)
         event.canvas.draw_idle()
 
-        new_data = data_gen(specs, regen=self.regen, cancel_event=self.cancel_event)
-        if new_data is not None:
-            mandelbrot_viz(new_data, self.handle)
-            if self.history_handle is not None:
-                self.history_handle.append(specs)
+        self.request(specs, self.history_handle.append if self.history_handle is not None else None)
 
     def _on_iteration_change(self, text):
         try:
@@ -136,12 +322,5 @@ class MandelbrotCtrl:
             print(f'Invalid number: {text}')
             return
 
-        if self.cancel_event is not None:
-            self.cancel_event.clear()
-
         specs = PlotSpecs(*self.handle.ax.get_xlim() + self.handle.ax.get_ylim(), iterations)
-        new_data = data_gen(specs, regen=self.regen, cancel_event=self.cancel_event)
-        if new_data is not None:
-            mandelbrot_viz(new_data, handle=self.handle)
-            if self.history_handle is not None:
-                self.history_handle.append(specs)
+        self.request(specs, self.history_handle.append if self.history_handle is not None else None)
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from decimal import Decimal
+from decimal import Decimal, localcontext
 
 import numpy as np
 
@@ -38,12 +38,153 @@ def dcomplex_zeroes(shape):
 def dcomplex_add(a: np.ndarray, b: np.ndarray) -> np.ndarray:
     if a.shape != b.shape:
         raise ValueError("Shapes must match for addition.")
+    if isinstance(a, DDComplex):
+        return ddcomplex_add(a, b)
     return np.vectorize(lambda x, y: x + y, otypes=[object])(a, b)
 
 
 def dcomplex_sq(a: np.ndarray) -> np.ndarray:
+    if isinstance(a, DDComplex):
+        return ddcomplex_sq(a)
     return np.vectorize(lambda x: x * x, otypes=[object])(a)
 
 
 def dcomplex_abs(a: np.ndarray) -> np.ndarray:
+    if isinstance(a, DDComplex):
+        return np.sqrt(ddcomplex_norm(a))
     return np.vectorize(abs, otypes=[object])(a)
+
+
+# Double-double arithmetic: every real is an unevaluated sum hi + lo of two float64s (~32 significant digits).
+# All operations are plain numpy expressions, so they run on whole arrays at once.
+DD_DIGITS = 28  # deepest pixel pitch (in decimal places) a double-double grid still resolves with headroom
+_SPLITTER = 134217729.0  # 2 ** 27 + 1
+
+
+def two_sum(a, b):
+    s = a + b
+    bb = s - a
+    return s, (a - (s - bb)) + (b - bb)
+
+
+def quick_two_sum(a, b):
+    s = a + b
+    return s, b - (s - a)
+
+
+def _split(a):
+    t = _SPLITTER * a
+    hi = t - (t - a)
+    return hi, a - hi
+
+
+def two_prod(a, b):
+    p = a * b
+    ah, al = _split(a)
+    bh, bl = _split(b)
+    return p, ((ah * bh - p) + ah * bl + al * bh) + al * bl
+
+
+def dd_add(ah, al, bh, bl):
+    s, e = two_sum(ah, bh)
+    t, f = two_sum(al, bl)
+    s, e = quick_two_sum(s, e + t)
+    return quick_two_sum(s, e + f)
+
+
+def dd_mul(ah, al, bh, bl):
+    p, e = two_prod(ah, bh)
+    return quick_two_sum(p, e + (ah * bl + al * bh))
+
+
+def dd_from_decimal(d: Decimal):
+    hi = float(d)
+    return hi, float(d - Decimal(hi))
+
+
+@dataclass(frozen=True)
+class DDComplex:
+    """
+    Struct-of-arrays complex number with double-double real and imaginary parts.
+    Supports the shape / indexing protocol used by the kernels, so it can stand in for an object array of DComplex.
+    """
+    re_hi: np.ndarray
+    re_lo: np.ndarray
+    im_hi: np.ndarray
+    im_lo: np.ndarray
+
+    @property
+    def shape(self):
+        return self.re_hi.shape
+
+    def __getitem__(self, key) -> 'DDComplex':
+        return DDComplex(self.re_hi[key], self.re_lo[key], self.im_hi[key], self.im_lo[key])
+
+    def __setitem__(self, key, value: 'DDComplex'):
+        self.re_hi[key] = value.re_hi
+        self.re_lo[key] = value.re_lo
+        self.im_hi[key] = value.im_hi
+        self.im_lo[key] = value.im_lo
+
+    def to_complex(self) -> np.ndarray:
+        return (self.re_hi + self.re_lo) + 1j * (self.im_hi + self.im_lo)
+
+
+def ddcomplex_zeroes(shape) -> DDComplex:
+    return DDComplex(np.zeros(shape), np.zeros(shape), np.zeros(shape), np.zeros(shape))
+
+
+def ddcomplex_split(a: DDComplex, sections, axis=0) -> list[DDComplex]:
+    parts = [np.array_split(p, sections, axis=axis) for p in (a.re_hi, a.re_lo, a.im_hi, a.im_lo)]
+    return [DDComplex(*p) for p in zip(*parts)]
+
+
+def ddcomplex_concat(chunks, axis=0) -> DDComplex:
+    return DDComplex(*(np.concatenate(p, axis=axis) for p in zip(*((c.re_hi, c.re_lo, c.im_hi, c.im_lo) for c in chunks))))
+
+
+def ddcomplex_add(a: DDComplex, b: DDComplex) -> DDComplex:
+    return DDComplex(*dd_add(a.re_hi, a.re_lo, b.re_hi, b.re_lo), *dd_add(a.im_hi, a.im_lo, b.im_hi, b.im_lo))
+
+
+def ddcomplex_mul(a: DDComplex, b: DDComplex) -> DDComplex:
+    ac = dd_mul(a.re_hi, a.re_lo, b.re_hi, b.re_lo)
+    bd = dd_mul(a.im_hi, a.im_lo, b.im_hi, b.im_lo)
+    ad = dd_mul(a.re_hi, a.re_lo, b.im_hi, b.im_lo)
+    bc = dd_mul(a.im_hi, a.im_lo, b.re_hi, b.re_lo)
+    return DDComplex(*dd_add(*ac, -bd[0], -bd[1]), *dd_add(*ad, *bc))
+
+
+def ddcomplex_sq(a: DDComplex) -> DDComplex:
+    aa = dd_mul(a.re_hi, a.re_lo, a.re_hi, a.re_lo)
+    bb = dd_mul(a.im_hi, a.im_lo, a.im_hi, a.im_lo)
+    ab = dd_mul(a.re_hi, a.re_lo, a.im_hi, a.im_lo)
+    return DDComplex(*dd_add(*aa, -bb[0], -bb[1]), 2 * ab[0], 2 * ab[1])
+
+
+def ddcomplex_norm(a: DDComplex) -> np.ndarray:
+    """
+    Squared magnitude, rounded to float64.
+    """
+    aa = dd_mul(a.re_hi, a.re_lo, a.re_hi, a.re_lo)
+    bb = dd_mul(a.im_hi, a.im_lo, a.im_hi, a.im_lo)
+    hi, lo = dd_add(*aa, *bb)
+    return hi + lo
+
+
+def dd_linspace(start: Decimal, stop: Decimal, num):
+    with localcontext() as ctx:
+        ctx.prec = 2 * DD_DIGITS
+        step = (stop - start) / (num - 1) if num > 1 else Decimal(0)
+    index = np.arange(num, dtype=np.float64)
+    return dd_add(*dd_from_decimal(start), *dd_mul(*dd_from_decimal(step), index, np.zeros(num)))
+
+
+def ddcomplex_offset(cx: Decimal, cy: Decimal, offsets: np.ndarray) -> DDComplex:
+    """
+    The points cx + i*cy + offsets, where the float64 offsets are added in double-double precision.
+    """
+    zeroes = np.zeros(offsets.shape)
+    re_hi, re_lo = dd_add(*dd_from_decimal(cx), np.real(offsets), zeroes)
+    im_hi, im_lo = dd_add(*dd_from_decimal(cy), np.imag(offsets), zeroes)
+    return DDComplex(re_hi, re_lo, im_hi, im_lo)
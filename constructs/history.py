@@ -1,17 +1,71 @@
+from collections import OrderedDict
+from dataclasses import astuple
 from multiprocessing import Event
 
 from constructs.calc import data_gen
-from constructs.viz import mandelbrot_viz
-from constructs.model import PlotHandle, PlotSpecs
+from constructs.viz import mandelbrot_viz, show_frame
+from constructs.model import PlotHandle, PlotSpecs, Frame
+
+FRAME_BUDGET = 2 ** 28  # bytes of rendered frames kept in memory for undo, redo and reset
+FRAME_STRIDE = 1  # keep every FRAME_STRIDE-th pixel of the frames; above 1 a frame is only a preview of the full render
 
 
 class HistoryCtrl:
-    def __init__(self, handle: PlotHandle, cancel_event: Event = None):
+    def __init__(self, handle: PlotHandle, cancel_event: Event = None, frame_budget=FRAME_BUDGET, frame_stride=FRAME_STRIDE):
         self.history = [PlotSpecs(*handle.ax.get_xlim(), *handle.ax.get_ylim(), iterations=handle.iterations)]
         self.index = 0
         self.handle = handle
         self.init_specs = self.history[0]
         self.cancel_event = cancel_event
+        self.renderer = None  # request(specs, on_done, render=True) of the controller rendering in the background, if any
+
+        self.frames = OrderedDict()  # astuple(specs) -> Frame, least recently used first
+        self.frame_bytes = 0
+        self.frame_budget = frame_budget
+        self.frame_stride = frame_stride
+        if handle.img is not None:
+            self.remember_frame(self.init_specs)
+
+    def remember_frame(self, specs: PlotSpecs):
+        """
+        Keep the image on screen as the frame of specs, dropping the least recently used frames beyond the budget.
+        """
+        vmin, vmax = self.handle.im.get_clim()
+        frame = Frame(self.handle.img[::self.frame_stride, ::self.frame_stride].copy(), self.handle.im.get_cmap(), vmin, vmax,
+                      self.handle.palette, self.frame_stride)
+        previous = self.frames.pop(astuple(specs), None)
+        if previous is not None:
+            self.frame_bytes -= previous.img.nbytes
+        self.frames[astuple(specs)] = frame
+        self.frame_bytes += frame.img.nbytes
+        while self.frame_bytes > self.frame_budget and self.frames:
+            _, dropped = self.frames.popitem(last=False)
+            self.frame_bytes -= dropped.img.nbytes
+
+    def show(self, specs: PlotSpecs, record=False):
+        """
+        Show the frame kept for specs at once if there is one. Unless that frame is at full resolution and in the current palette,
+        render specs through the renderer if there is one, right away otherwise. With record, specs is appended once shown.
+        """
+        on_done = self.append if record else None
+        frame = self.frames.get(astuple(specs))
+        if frame is not None:
+            self.frames.move_to_end(astuple(specs))
+            show_frame(frame, self.handle)
+            if frame.stride == 1 and frame.palette == self.handle.palette:
+                if self.renderer is not None:
+                    self.renderer(specs, on_done, render=False)
+                elif record:
+                    self.append(specs)
+                return
+        if self.renderer is not None:
+            self.renderer(specs, on_done)
+            return
+        new_data = data_gen(specs)
+        mandelbrot_viz(new_data, self.handle)
+        self.remember_frame(specs)
+        if record:
+            self.append(specs)
 
     def reset(self, event):
         print(f"Reset event")
@@ -24,9 +78,7 @@ class HistoryCtrl:
         self.handle.update_iter_box(specs.iterations)
         self.handle.fig.canvas.draw_idle()
 
-        new_data = data_gen(specs)
-        mandelbrot_viz(new_data, self.handle)
-        self.append(specs)
+        self.show(specs, record=True)
 
     def undo(self, event):
         if self.index > 0:
@@ -41,8 +93,7 @@ class HistoryCtrl:
             self.handle.update_iter_box(specs.iterations)
             self.handle.fig.canvas.draw_idle()
 
-            new_data = data_gen(specs)
-            mandelbrot_viz(new_data, self.handle)
+            self.show(specs)
         else:
             print("Undo event ignored-history is empty.")
 
@@ -58,8 +109,7 @@ class HistoryCtrl:
             self.handle.update_iter_box(specs.iterations)
             self.handle.fig.canvas.draw_idle()
 
-            new_data = data_gen(specs)
-            mandelbrot_viz(new_data, self.handle)
+            self.show(specs)
         else:
             print("Redo event ignored-already latest.")
 
@@ -2,9 +2,11 @@ from dataclasses import dataclass
 
 import numpy as np
 from matplotlib import pyplot as plt, image, colorbar
-from matplotlib.colors import LinearSegmentedColormap
+from matplotlib.colors import Colormap, LinearSegmentedColormap
 from matplotlib.widgets import Button, TextBox
 
+from constructs.palette import colorize, palette_colormap, palette_counts
+
 MAX_ITERATIONS = 2048
 PIXEL_X, PIXEL_Y = 2560, 1600
 CMAP_EXT = LinearSegmentedColormap.from_list(
@@ -36,23 +38,19 @@ class MandelbrotData:
     interior: np.ndarray
     specs: np.ndarray
     Z: np.ndarray = None
-
-    def to_viz_data(self) -> 'MandelbrotViz':
-        escapes = self.escapes
-        interior = self.interior
+    precision: str = None  # precision tier the dataset was computed with, see constructs.calc.precision_tier
+    complete: bool = True  # False for what a cancelled render got done, never cached
+
+    def to_viz_data(self, palette='linear', out: np.ndarray = None) -> 'MandelbrotViz':
+        """
+        Color the dataset with the given palette, see constructs.palette. Recoloring never touches the compute or the cache.
+        The colormap goes with it, so that a colorbar shows the escape counts in the colors of the palette.
+        """
         specs = PlotSpecs(*self.specs)
-        pixelx, pixely = escapes.shape
-
-        # Create image array
-        img = np.zeros((pixelx, pixely, 3))
-        # Normalize exterior values for coloring
-        vmin, vmax = escapes.min(), escapes.max()
-        norm_div = (escapes / vmax) if vmax > 0 else escapes
-        # Apply colormap to diverged (exterior) points
-        img[~interior] = CMAP_EXT(norm_div[~interior])[:, :3]  # drop alpha
-        # Set interior (non-diverged) points to solid color (e.g., black)
-        img[interior] = [0, 0, 0]  # dark interior
-        return MandelbrotViz(img, CMAP_EXT, vmin, vmax, specs)
+        vmax = self.escapes.max(initial=0)
+        counts = palette_counts(self.escapes, self.interior, vmax) if palette == 'histogram' else None
+        img = colorize(self.escapes, self.interior, CMAP_EXT, palette, out, vmax, counts)
+        return MandelbrotViz(img, palette_colormap(self.escapes, self.interior, CMAP_EXT, palette, vmax, counts), 0, vmax, specs)
 
     def to_specs(self) -> PlotSpecs:
         return PlotSpecs(*self.specs)
@@ -69,6 +67,8 @@ class PlotHandle:
     btn_redo: Button
     iter_box: TextBox
     iterations: int
+    palette: str = 'linear'
+    img: np.ndarray = None  # RGB buffer reused across frames
 
     def update_iter_box(self, iterations, events_on=False):
         self.iterations = iterations
@@ -81,10 +81,23 @@ class PlotHandle:
         box.eventson = eventson
 
 
+@dataclass(frozen=True)
+class Frame:
+    """
+    A rendered RGB image kept by the history, every stride-th pixel of the full image, along with its colormap and color limits.
+    """
+    img: np.ndarray
+    cmap: Colormap
+    vmin: float
+    vmax: float
+    palette: str
+    stride: int = 1
+
+
 @dataclass(frozen=True)
 class MandelbrotViz:
     img: np.ndarray
-    cmap: LinearSegmentedColormap
+    cmap: Colormap
     vmin: float
     vmax: float
     specs: PlotSpecs
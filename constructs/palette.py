@@ -0,0 +1,81 @@
+import numpy as np
+from matplotlib import colormaps
+from matplotlib.colors import Colormap, ListedColormap
+
+LUT_SIZE = 1024
+CYCLE_LENGTH = 32  # escape iterations per turn of the cyclic palette
+CMAP_CYCLIC = colormaps['twilight_shifted']
+PALETTES = ('linear', 'histogram', 'cyclic')
+
+_luts = {}
+
+
+def palette_lut(cmap: Colormap) -> np.ndarray:
+    """
+    The colormap sampled at LUT_SIZE points as uint8 RGB, computed once per colormap.
+    """
+    if cmap.name not in _luts:
+        _luts[cmap.name] = np.round(cmap((np.arange(LUT_SIZE) + .5) / LUT_SIZE)[:, :3] * 255).astype(np.uint8)
+    return _luts[cmap.name]
+
+
+def palette_index(escapes: np.ndarray, interior: np.ndarray, palette='linear', vmax=None, counts=None) -> np.ndarray:
+    """
+    Map every escape count to an entry of the lookup table of the palette:
+    'linear' scales by the highest escape count, 'histogram' equalizes the histogram of the exterior escape counts
+    so that every color covers about as many pixels, and 'cyclic' wraps around every CYCLE_LENGTH iterations.
+    vmax and counts, see palette_counts, default to those of escapes: pass the ones of a whole image to color a part of it.
+    """
+    if palette == 'cyclic':
+        return (np.mod(escapes, CYCLE_LENGTH) * (LUT_SIZE / CYCLE_LENGTH)).astype(np.intp) % LUT_SIZE
+    if vmax is None:
+        vmax = escapes.max(initial=0)
+    index = linear_index(escapes, vmax)
+    if palette == 'linear':
+        return index
+    if palette == 'histogram':
+        if counts is None:
+            counts = palette_counts(escapes, interior, vmax)
+        cdf = np.cumsum(counts) / max(counts.sum(), 1)
+        return np.minimum((cdf * LUT_SIZE).astype(np.intp), LUT_SIZE - 1)[index]
+    raise ValueError(f"Unknown palette {palette!r}, expected one of {PALETTES}")
+
+
+def linear_index(escapes: np.ndarray, vmax) -> np.ndarray:
+    scaled = escapes / vmax * LUT_SIZE if vmax > 0 else np.zeros(escapes.shape)
+    return np.clip(scaled.astype(np.intp), 0, LUT_SIZE - 1)
+
+
+def palette_counts(escapes: np.ndarray, interior: np.ndarray, vmax) -> np.ndarray:
+    """
+    Histogram of the exterior escape counts over the LUT_SIZE linear bins up to vmax. Histograms of parts of an image add up.
+    """
+    return np.bincount(linear_index(escapes, vmax)[~interior], minlength=LUT_SIZE)
+
+
+def colorize(escapes: np.ndarray, interior: np.ndarray, cmap: Colormap, palette='linear', out: np.ndarray = None,
+             vmax=None, counts=None) -> np.ndarray:
+    """
+    Color the escape counts as a uint8 RGB image through the lookup table of cmap, interior points black.
+    The image is written to out when it has the right shape, so that a buffer can be reused across frames.
+    """
+    shape = (*escapes.shape, 3)
+    if out is None or out.shape != shape or out.dtype != np.uint8:
+        out = np.empty(shape, dtype=np.uint8)
+    lut = palette_lut(CMAP_CYCLIC if palette == 'cyclic' else cmap)
+    np.take(lut, palette_index(escapes, interior, palette, vmax, counts), axis=0, out=out)
+    out[interior] = 0
+    return out
+
+
+def palette_colormap(escapes: np.ndarray, interior: np.ndarray, cmap: Colormap, palette='linear', vmax=None, counts=None) -> Colormap:
+    """
+    The colormap giving the escape counts from 0 to vmax the colors colorize gives them, for a colorbar of the image.
+    """
+    if vmax is None:
+        vmax = escapes.max(initial=0)
+    if palette == 'histogram' and counts is None:
+        counts = palette_counts(escapes, interior, vmax)
+    samples = (np.arange(LUT_SIZE) + .5) / LUT_SIZE * vmax
+    lut = palette_lut(CMAP_CYCLIC if palette == 'cyclic' else cmap)
+    return ListedColormap(lut[palette_index(samples, np.zeros(LUT_SIZE, dtype=bool), palette, vmax, counts)] / 255, f'{cmap.name}-{palette}')
@@ -0,0 +1,85 @@
+import math
+from decimal import Decimal, localcontext
+
+import numpy as np
+
+from constructs.model import PlotSpecs
+
+GUARD_DIGITS = 12
+
+
+def to_decimal(x) -> Decimal:
+    # floats convert exactly; long doubles only through their round-trip repr
+    return Decimal(x) if isinstance(x, (int, float, Decimal)) else Decimal(str(x))
+
+
+def pixel_digits(specs: PlotSpecs) -> int:
+    """
+    Decimal places of the pixel pitch of the given view, e.g. 18 for a pitch of 4e-18.
+    """
+    pitch = min(to_decimal(specs.xmax) - to_decimal(specs.xmin), to_decimal(specs.ymax) - to_decimal(specs.ymin)) / max(specs.width, specs.height)
+    if pitch <= 0:
+        return 28
+    return -math.floor(pitch.log10())
+
+
+def orbit_digits(specs: PlotSpecs) -> int:
+    """
+    Decimal digits needed for the reference orbit to resolve adjacent pixels of the given view.
+    """
+    return max(28, pixel_digits(specs) + GUARD_DIGITS)
+
+
+def view_center(specs: PlotSpecs) -> tuple[Decimal, Decimal]:
+    with localcontext() as ctx:
+        ctx.prec = orbit_digits(specs)
+        cx = (to_decimal(specs.xmin) + to_decimal(specs.xmax)) / 2
+        cy = (to_decimal(specs.ymin) + to_decimal(specs.ymax)) / 2
+    return cx, cy
+
+
+def reference_orbit(cx: Decimal, cy: Decimal, iterations, threshold, digits, cancel_event=None) -> np.ndarray:
+    """
+    Iterate the reference point c = cx + i*cy in arbitrary precision.
+    Returns Z_0 .. Z_n rounded to complex128, where n <= iterations stops early once the reference escapes, or once cancelled.
+    """
+    from constructs.calc import CANCEL_CHECK  # calc imports this module
+
+    orbit = np.zeros(iterations + 1, dtype=np.complex128)
+    bailout = Decimal(threshold) ** 2
+    with localcontext() as ctx:
+        ctx.prec = digits
+        zr, zi = Decimal(0), Decimal(0)
+        for i in range(iterations):
+            if cancel_event is not None and i % CANCEL_CHECK == 0 and cancel_event.is_set():
+                return orbit[:i + 1]
+            zr, zi = zr * zr - zi * zi + cx, 2 * zr * zi + cy
+            orbit[i + 1] = complex(float(zr), float(zi))
+            if zr * zr + zi * zi > bailout:
+                return orbit[:i + 2]
+    return orbit
+
+
+def delta_grid(specs: PlotSpecs, cx: Decimal, cy: Decimal) -> np.ndarray:
+    """
+    Offsets of every pixel from the reference point (cx, cy) as complex128.
+    Only the offsets are rounded to float, so they stay exact to float precision at any zoom depth.
+    """
+    with localcontext() as ctx:
+        ctx.prec = orbit_digits(specs)
+        xmin, xmax = to_decimal(specs.xmin), to_decimal(specs.xmax)
+        ymin, ymax = to_decimal(specs.ymin), to_decimal(specs.ymax)
+        x0, dx = float(xmin - cx), float(xmax - xmin)
+        y0, dy = float(ymin - cy), float(ymax - ymin)
+    x = x0 + dx * np.linspace(0, 1, specs.width)
+    y = y0 + dy * np.linspace(0, 1, specs.height)
+    return x[np.newaxis, :] + 1j * y[:, np.newaxis]
+
+
+def pick_reference(dC: np.ndarray, glitched: np.ndarray) -> complex:
+    """
+    Choose the next reference among the glitched pixels: the one closest to the centroid of the glitched offsets.
+    """
+    candidates = dC[glitched]
+    centroid = candidates.mean()
+    return candidates[np.argmin(np.abs(candidates - centroid))]
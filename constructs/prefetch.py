@@ -0,0 +1,55 @@
+from constructs.cache import cache_manager
+from constructs.calc import use_perturbation
+from constructs.model import PlotSpecs
+from constructs.tiles import tile_level, tiles_covering
+
+
+def zoom_specs(view: PlotSpecs, x, y, scale) -> PlotSpecs:
+    """
+    The view scaled by scale around (x, y), as a scroll of the controller renders it.
+    """
+    width, height = (view.xmax - view.xmin) * scale, (view.ymax - view.ymin) * scale
+    return PlotSpecs(x - width / 2, x + width / 2, y - height / 2, y + height / 2)
+
+
+def prefetch_candidates(view: PlotSpecs, cursor, zoom_factor, history: list, index) -> list[PlotSpecs]:
+    """
+    The views most likely to be requested next, most likely first:
+    one zoom step in around the cursor, the undo and redo targets of the history, then one zoom step out around the cursor.
+    """
+    candidates = []
+    if cursor is not None:
+        candidates.append(zoom_specs(view, *cursor, zoom_factor))
+    if index > 0:
+        candidates.append(history[index - 1])
+    if index < len(history) - 1:
+        candidates.append(history[index + 1])
+    if cursor is not None:
+        candidates.append(zoom_specs(view, *cursor, 1 / zoom_factor))
+    return candidates
+
+
+def view_keys(specs: PlotSpecs) -> dict:
+    """
+    What a render of specs leaves in the cache, as {key: iterations}: its lattice tiles, or the view itself when too deep for tiles.
+    """
+    if use_perturbation(specs):
+        return {(specs.xmin, specs.xmax, specs.ymin, specs.ymax): specs.iterations}
+    level = tile_level(specs)
+    return {(level, *key): specs.iterations for key in tiles_covering(specs, level)}
+
+
+def covered(keys: dict, prefetched: dict) -> bool:
+    """
+    Whether every key was prefetched with at least as many iterations, fewer being derived from the cache by truncation.
+    """
+    return all(prefetched.get(key, -1) >= iterations for key, iterations in keys.items())
+
+
+def is_cached(specs: PlotSpecs) -> bool:
+    """
+    Whether a render of specs would find everything it needs in the cache already.
+    """
+    if use_perturbation(specs):
+        return cache_manager.exists(specs)
+    return all(cache_manager.tile_exists(*key, iterations) for key, iterations in view_keys(specs).items())
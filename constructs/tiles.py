@@ -0,0 +1,66 @@
+import numpy as np
+
+from constructs.model import PlotSpecs
+
+TILE_SIZE = 128  # pixels per tile side, a multiple of every progressive stride
+BASE_PITCH = 2.0 ** -7  # lattice pitch at zoom level 0, about the pixel pitch of the full view at 640 pixels
+LATTICE_LIMIT = 2 ** 53  # lattice indices below this are exact in float64
+
+
+def tile_level(specs: PlotSpecs) -> int:
+    """
+    Coarsest zoom level whose lattice pitch BASE_PITCH / 2 ** level is at most the pixel pitch of the view on both axes,
+    so that no two pixels of the view fall on the same lattice point.
+    """
+    pitch = min((specs.xmax - specs.xmin) / (specs.width - 1), (specs.ymax - specs.ymin) / (specs.height - 1))
+    return int(np.ceil(np.log2(BASE_PITCH / pitch)))
+
+
+def lattice_pitch(level) -> float:
+    # a power of two, so that lattice points are exact floats
+    return BASE_PITCH / 2.0 ** level
+
+
+def lattice_exact(specs: PlotSpecs) -> bool:
+    """
+    Whether the lattice indices of the view are exact integers in float64, as lattice_index and tile_specs need.
+    """
+    pitch = lattice_pitch(tile_level(specs))
+    return max(abs(specs.xmin), abs(specs.xmax), abs(specs.ymin), abs(specs.ymax)) / pitch < LATTICE_LIMIT
+
+
+def lattice_axis(vmin, vmax, count, pitch) -> np.ndarray:
+    """
+    Indices of the lattice points nearest to count points evenly spaced from vmin to vmax, in units of pitch.
+    The index of vmin is exact, pitch being a power of two, and the offsets from it are small enough to be exact too,
+    so that points a pitch or more apart never share an index however deep the view.
+    """
+    start = vmin / pitch
+    origin = np.rint(start)
+    offsets = (start - origin) + np.linspace(0, (vmax - vmin) / pitch, count)
+    return int(origin) + np.rint(offsets).astype(np.int64)
+
+
+def lattice_index(specs: PlotSpecs, level, stride=1):
+    """
+    Map the pixels of the view, sampled every stride pixels, to the nearest lattice points of the given level
+    whose indices are multiples of stride. Returns the tile and in-tile indices (tx, lx) of the columns and (ty, ly) of the rows.
+    """
+    pitch = lattice_pitch(level) * stride
+    width, height = -(-specs.width // stride), -(-specs.height // stride)
+    ix = lattice_axis(float(specs.xmin), float(specs.xmax), width, pitch) * stride
+    iy = lattice_axis(float(specs.ymin), float(specs.ymax), height, pitch) * stride
+    tx, lx = np.divmod(ix, TILE_SIZE)
+    ty, ly = np.divmod(iy, TILE_SIZE)
+    return tx, lx, ty, ly
+
+
+def tiles_covering(specs: PlotSpecs, level) -> list[tuple[int, int]]:
+    tx, _, ty, _ = lattice_index(specs, level)
+    return [(x, y) for y in np.unique(ty).tolist() for x in np.unique(tx).tolist()]
+
+
+def tile_specs(level, tx, ty, iterations) -> PlotSpecs:
+    pitch = lattice_pitch(level)
+    x0, y0 = tx * TILE_SIZE, ty * TILE_SIZE
+    return PlotSpecs(x0 * pitch, (x0 + TILE_SIZE - 1) * pitch, y0 * pitch, (y0 + TILE_SIZE - 1) * pitch, iterations, TILE_SIZE, TILE_SIZE)
@@ -1,7 +1,7 @@
 from matplotlib import pyplot as plt
 from matplotlib.widgets import Button, TextBox
 
-from constructs.model import PlotHandle, MandelbrotData
+from constructs.model import PlotHandle, MandelbrotData, Frame
 
 
 def static_buttons(fig):
@@ -24,8 +24,8 @@ def static_buttons(fig):
 
 
 def mandelbrot_viz(mandelData: MandelbrotData, handle: PlotHandle = None) -> PlotHandle:
-    viz_data = mandelData.to_viz_data()
     if handle is None:
+        viz_data = mandelData.to_viz_data()
         fig, ax = plt.subplots()
         fig.subplots_adjust(left=0, right=1, top=1, bottom=0)
 
@@ -40,13 +40,16 @@ def mandelbrot_viz(mandelData: MandelbrotData, handle: PlotHandle = None) -> Plo
         cbar = plt.colorbar(im, ax=ax, shrink=0.8, pad=0.03)
         cbar.set_label("Escape Time (Smoothed Iterations)")
         btn_undo, btn_reset, btn_redo, iter_box = static_buttons(fig)
-        handle = PlotHandle(fig, ax, im, cbar, btn_undo, btn_reset, btn_redo, iter_box, iterations=viz_data.specs.iterations)
+        handle = PlotHandle(fig, ax, im, cbar, btn_undo, btn_reset, btn_redo, iter_box, iterations=viz_data.specs.iterations, img=viz_data.img)
         handle.update_iter_box(viz_data.specs.iterations)
         return handle
 
     fig, ax, im = handle.fig, handle.ax, handle.im
+    viz_data = mandelData.to_viz_data(handle.palette, handle.img)
+    handle.img = viz_data.img
     im.set_data(viz_data.img)
     im.set_extent(ax.get_xlim() + ax.get_ylim())
+    im.set_cmap(viz_data.cmap)
     im.set_clim(vmin=viz_data.vmin, vmax=viz_data.vmax)
     fig.canvas.draw_idle()
 
@@ -54,3 +57,24 @@ def mandelbrot_viz(mandelData: MandelbrotData, handle: PlotHandle = None) -> Plo
     # plt.savefig(f"{filename}.png", dpi=600, bbox_inches="tight", pad_inches=0)
     handle.iterations = viz_data.specs.iterations
     return handle
+
+
+def recolor(mandelData: MandelbrotData, handle: PlotHandle, palette) -> PlotHandle:
+    """
+    Show the dataset again with another palette, without computing anything.
+    """
+    handle.palette = palette
+    return mandelbrot_viz(mandelData, handle)
+
+
+def show_frame(frame: Frame, handle: PlotHandle) -> PlotHandle:
+    """
+    Show an image rendered earlier in place of the current one, stretched over the axes when downsampled.
+    The frame keeps its own buffer: the next render goes to handle.img as usual.
+    """
+    handle.im.set_data(frame.img)
+    handle.im.set_extent(handle.ax.get_xlim() + handle.ax.get_ylim())
+    handle.im.set_cmap(frame.cmap)
+    handle.im.set_clim(vmin=frame.vmin, vmax=frame.vmax)
+    handle.fig.canvas.draw_idle()
+    return handle
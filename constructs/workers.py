@@ -0,0 +1,229 @@
+import atexit
+import os
+import time
+from dataclasses import dataclass
+from multiprocessing import Pool, Event, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+ESTIMATE_SAMPLES = 16  # points per part iterated by the pre-pass to rank parts by cost
+ESTIMATE_ITERATIONS = 256  # iterations of the pre-pass, enough to tell cheap parts from costly ones
+ESTIMATE_MIN_WORK = 1 << 26  # point-iterations below which a run is too cheap for ranking its parts to pay off
+
+_pool = None
+
+
+@dataclass(frozen=True)
+class SharedBlock:
+    """
+    A flat array in shared memory, passed to the workers by name instead of pickling the array itself.
+    """
+    name: str
+    dtype: str
+    size: int
+
+
+def shared_empty(size, dtype) -> tuple[SharedMemory, np.ndarray]:
+    dtype = np.dtype(dtype)
+    shm = SharedMemory(create=True, size=max(1, size * dtype.itemsize))
+    return shm, np.ndarray(size, dtype=dtype, buffer=shm.buf)
+
+
+def attach(block: SharedBlock) -> tuple[SharedMemory, np.ndarray]:
+    shm = SharedMemory(name=block.name)
+    # the block belongs to the process that created it: keep the worker's resource tracker from unlinking it at exit
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm, np.ndarray(block.size, dtype=block.dtype, buffer=shm.buf)
+
+
+class CancelFlag:
+    """
+    A cancellation flag in one byte of shared memory, with the is_set, set and clear methods of Event.
+    It is pickled by name, so it can be handed to pool workers, and is_set is a memory read rather than
+    a round trip to a manager process. The time of the last set is kept in the process that set it.
+    """
+
+    def __init__(self, name: str = None):
+        self.shm = SharedMemory(name=name, create=name is None, size=1)
+        self.owner = name is None
+        if self.owner:
+            self.shm.buf[0] = 0
+            atexit.register(self.close)
+        else:
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+        self.set_time = None
+
+    def __reduce__(self):
+        return CancelFlag, (self.shm.name,)
+
+    def is_set(self) -> bool:
+        return self.shm.buf[0] != 0
+
+    def set(self):
+        if not self.is_set():
+            self.set_time = time.perf_counter()
+        self.shm.buf[0] = 1
+
+    def clear(self):
+        self.shm.buf[0] = 0
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+            self.owner = False
+
+
+def render_pool(processes) -> Pool:
+    """
+    The pool every render runs in, started on first use and kept alive until exit.
+    """
+    global _pool
+    if _pool is None:
+        _pool = Pool(processes=processes)
+        atexit.register(close_pool)
+    return _pool
+
+
+def close_pool():
+    global _pool
+    if _pool is not None:
+        _pool.terminate()
+        _pool = None
+
+
+def run_shared(pool: Pool, parts, cancel_event: Event, period_tol: float = None, timings: list = None):
+    """
+    Run kernels over parts of the pixels in the pool, the workers reading and writing shared memory.
+    parts is a list of (kernel, C, Z, iterations), each kernel called as mandelbrot_calc on its C and Z in their own dtype.
+    The inputs are laid out one part after the other in flat shared arrays of the widest dtype, and so are the results:
+    returns the flat escapes, interior mask and Z along with the periodic count of every part and whether it completed.
+    Once cancelled, the parts still running stop at their next check and the ones not started are skipped:
+    only the parts that completed hold valid results.
+    Parts are handed out one at a time to whichever worker is free, the most expensive first as estimated by estimate_costs,
+    unless there are no more tasks than workers or less than ESTIMATE_MIN_WORK point-iterations, where the pre-pass can't pay off.
+    Once all parts complete, the utilization of the workers is reported, unless timings is given: the (pid, busy seconds)
+    of every task are then added to it, for a caller running several passes to report once per render.
+    """
+    sizes = [C.size for _, C, _, _ in parts]
+    bounds = np.concatenate(([0], np.cumsum(sizes))).tolist()
+    size = bounds[-1]
+    dtype = np.result_type(*(C.dtype for _, C, _, _ in parts), *(Z.dtype for _, _, Z, _ in parts))
+    fields = {'C': dtype, 'Z': dtype, 'escapes': np.float64, 'interior': bool, 'Z_out': dtype}
+    shms, arrays, blocks = {}, {}, {}
+    try:
+        for field, dtype in fields.items():
+            shms[field], arrays[field] = shared_empty(size, dtype)
+            blocks[field] = SharedBlock(shms[field].name, np.dtype(dtype).str, size)
+        tasks = []
+        for n, ((kernel, C, Z, iterations), start, stop) in enumerate(zip(parts, bounds[:-1], bounds[1:])):
+            arrays['C'][start:stop], arrays['Z'][start:stop] = C.ravel(), Z.ravel()
+            if stop > start:
+                tasks.append((n, kernel, blocks, start, stop, C.shape, C.dtype.str, iterations, cancel_event, period_tol))
+        if len(tasks) > pool._processes and size * max(iterations for _, _, _, iterations in parts) >= ESTIMATE_MIN_WORK:
+            costs = estimate_costs(parts, cancel_event, period_tol)
+            tasks.sort(key=lambda task: -costs[task[0]])
+        periodic_counts = [0] * len(parts)
+        complete = [C.size == 0 for _, C, _, _ in parts]
+        report = timings is None
+        timings = [] if report else timings
+        start_time = time.perf_counter()
+        for n, periodic_count, finished, pid, busy in pool.imap_unordered(run_task, tasks):
+            periodic_counts[n], complete[n] = periodic_count, finished
+            timings.append((pid, busy))
+        if report and all(complete):
+            report_utilization(utilization(timings, time.perf_counter() - start_time))
+        return arrays['escapes'].copy(), arrays['interior'].copy(), arrays['Z_out'].copy(), periodic_counts, complete
+    finally:
+        arrays.clear()  # no view may outlive the block it points into
+        for shm in shms.values():
+            shm.close()
+            shm.unlink()
+
+
+def estimate_costs(parts, cancel_event: Event = None, period_tol: float = None) -> np.ndarray:
+    """
+    Coarse pre-pass: iterate ESTIMATE_SAMPLES points of every part, all parts at once and at most ESTIMATE_ITERATIONS times,
+    and estimate the cost of a part as its size times the mean number of iterations of its samples.
+    Subdivision fills interior rectangles without iterating them, so interior samples of those parts only count
+    for the border of the part, about 4 * sqrt(size) points.
+    """
+    from constructs.calc import mandelbrot_calc, mandelbrot_calc_subdivide  # the kernels import this module
+
+    samples = [np.linspace(0, C.size - 1, min(ESTIMATE_SAMPLES, C.size)).astype(int) for _, C, _, _ in parts]
+    C = np.concatenate([C.ravel()[sample] for (_, C, _, _), sample in zip(parts, samples)])
+    Z = np.concatenate([Z.ravel()[sample] for (_, _, Z, _), sample in zip(parts, samples)])
+    limits = np.concatenate([np.full(sample.size, min(iterations, ESTIMATE_ITERATIONS)) for (_, _, _, iterations), sample in zip(parts, samples)])
+    escapes, interior, _, _ = mandelbrot_calc(C, int(limits.max(initial=0)), Z, cancel_event, period_tol)
+    escapes = np.minimum(escapes, limits)
+    bounds = np.cumsum([sample.size for sample in samples])[:-1]
+    costs = []
+    for (kernel, C, _, iterations), part_escapes, part_interior in zip(parts, np.split(escapes, bounds), np.split(interior, bounds)):
+        if not part_escapes.size:
+            costs.append(0.0)
+        elif kernel is mandelbrot_calc_subdivide:
+            limit = min(iterations, ESTIMATE_ITERATIONS)
+            costs.append(C.size * np.where(part_interior, 0, part_escapes).mean() + part_interior.mean() * 4 * np.sqrt(C.size) * limit)
+        else:
+            costs.append(C.size * np.where(part_interior, min(iterations, ESTIMATE_ITERATIONS), part_escapes).mean())
+    return np.array(costs)
+
+
+def utilization(timings, wall) -> dict:
+    """
+    Fraction of the wall time every worker, by pid, spent computing.
+    """
+    busy = {}
+    for pid, seconds in timings:
+        busy[pid] = busy.get(pid, 0) + seconds
+    return {pid: seconds / wall for pid, seconds in busy.items()} if wall > 0 else {}
+
+
+def report_utilization(fractions: dict):
+    if fractions:
+        print(f"Workers: {len(fractions)} busy, utilization " + " ".join(f"{fraction:.0%}" for fraction in sorted(fractions.values(), reverse=True)))
+
+
+class SeenFlag:
+    """
+    The cancel flag as one kernel reads it. Every kernel breaks off as soon as is_set returns True,
+    so the kernel broke off early exactly when it has seen the flag set; a kernel done before the flag got set completed.
+    """
+
+    def __init__(self, flag):
+        self.flag = flag
+        self.seen = False
+
+    def is_set(self) -> bool:
+        self.seen = self.seen or self.flag.is_set()
+        return self.seen
+
+
+def run_task(task):
+    n, *args, cancel_event, period_tol = task
+    if cancel_event is not None and cancel_event.is_set():
+        return n, 0, False, os.getpid(), 0
+    start_time = time.perf_counter()
+    seen = SeenFlag(cancel_event) if cancel_event is not None else None
+    periodic_count = calc_shared(*args, seen, period_tol)
+    finished = seen is None or not seen.seen
+    return n, periodic_count, finished, os.getpid(), time.perf_counter() - start_time
+
+
+def calc_shared(kernel, blocks: dict, start, stop, shape, dtype, iterations, cancel_event: Event, period_tol: float = None):
+    shms, arrays = {}, {}
+    try:
+        for field, block in blocks.items():
+            shm, array = attach(block)
+            shms[field], arrays[field] = shm, array[start:stop]
+            del array
+        C, Z = (arrays[field].reshape(shape).astype(dtype, copy=False) for field in ('C', 'Z'))
+        diverging_order, mask_interior, Z, periodic_count = kernel(C, iterations, Z, cancel_event, period_tol)
+        del C
+        arrays['escapes'][:], arrays['interior'][:], arrays['Z_out'][:] = diverging_order.ravel(), mask_interior.ravel(), Z.ravel()
+        return periodic_count
+    finally:
+        arrays.clear()
+        for shm in shms.values():
+            shm.close()
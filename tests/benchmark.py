@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import replace
+
+import numpy as np
+
+from constructs import calc
+from constructs.cache import CacheManager
+from constructs.calc import clingrid, data_regen, dclingrid, mandelbrot_calc, mandelbrot_calc_dcomplex
+from constructs.decimal_complex import dcomplex_zeroes
+from constructs.workers import close_pool
+from mandelbrot import START_SPECS, RECTS
+
+BENCH_WIDTH, BENCH_HEIGHT = 320, 200
+DCOMPLEX_WIDTH, DCOMPLEX_HEIGHT, DCOMPLEX_ITERATIONS = 16, 10, 100  # Decimal arithmetic is orders of magnitude slower
+REPEATS = 3
+THRESHOLD = .25  # relative increase of wall time or peak memory over the baseline that fails the run
+BASELINE = os.path.join(os.path.dirname(__file__), 'benchmark_baseline.json')
+RSS_UNIT = 1 if sys.platform == 'darwin' else 2 ** 10  # bytes per unit of ru_maxrss: bytes on macOS, kilobytes elsewhere
+VIEWS = {'shallow': START_SPECS, 'deep': RECTS[0], 'overflow': RECTS[1]}
+
+
+def bench_specs(view):
+    return replace(VIEWS[view], width=BENCH_WIDTH, height=BENCH_HEIGHT)
+
+
+def pixel_iterations(escapes, interior, iterations) -> float:
+    return float(np.where(interior, iterations, np.clip(escapes, 0, iterations)).sum())
+
+
+def timed(run, repeats=REPEATS):
+    """
+    Best wall time of run over repeats, and its last result.
+    """
+    best = float('inf')
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        result = run()
+        best = min(best, time.perf_counter() - start_time)
+    return best, result
+
+
+def bench_calc(view):
+    specs = bench_specs(view)
+    C = clingrid(specs)
+    wall, (escapes, interior, _, _) = timed(lambda: mandelbrot_calc(C, specs.iterations, np.zeros_like(C), None))
+    return wall, pixel_iterations(escapes, interior, specs.iterations), 'pixel-iterations'
+
+
+def bench_dcomplex(view):
+    specs = replace(VIEWS[view], iterations=min(VIEWS[view].iterations, DCOMPLEX_ITERATIONS), width=DCOMPLEX_WIDTH, height=DCOMPLEX_HEIGHT)
+    C = dclingrid(specs)
+    wall, (escapes, interior, _) = timed(lambda: mandelbrot_calc_dcomplex(C, specs.iterations, dcomplex_zeroes(C.shape), None), repeats=1)
+    return wall, pixel_iterations(escapes, interior, specs.iterations), 'pixel-iterations'
+
+
+def bench_regen(view):
+    specs = bench_specs(view)
+    wall, dataset = timed(lambda: data_regen(specs, None))
+    return wall, pixel_iterations(dataset.escapes, dataset.interior, specs.iterations), 'pixel-iterations'
+
+
+def bench_commit(view):
+    specs = bench_specs(view)
+    dataset = data_regen(specs, None)
+    wall, _ = timed(lambda: calc.cache_manager.commit(specs, dataset))
+    return wall, specs.width * specs.height, 'pixels'
+
+
+def bench_load(view):
+    specs = bench_specs(view)
+    calc.cache_manager.commit(specs, data_regen(specs, None))
+
+    def load():
+        # a fresh manager has nothing in its RAM tier, so every load reads the files
+        cache_manager = CacheManager(calc.cache_manager.cache_dir)
+        dataset = cache_manager.load(cache_manager.gen_filename(specs), with_z=True)
+        return float(dataset.escapes.sum()) + float(np.abs(dataset.Z).sum())
+
+    wall, _ = timed(load)
+    return wall, specs.width * specs.height, 'pixels'
+
+
+def bench_viz(view):
+    specs = bench_specs(view)
+    dataset = data_regen(specs, None)
+    wall, _ = timed(dataset.to_viz_data)
+    return wall, specs.width * specs.height, 'pixels'
+
+
+BENCHES = {'calc': bench_calc, 'dcomplex': bench_dcomplex, 'regen': bench_regen,
+           'commit': bench_commit, 'load': bench_load, 'viz': bench_viz}
+CASES = [f'{bench}-{view}' for bench in BENCHES for view in VIEWS if bench in ('calc', 'dcomplex', 'regen') or view == 'shallow']
+
+
+def run_case(case) -> dict:
+    """
+    Run one case in this process against a cache of its own. Peak memory is that of this process and of its largest pool worker.
+    """
+    bench, view = case.split('-')
+    with tempfile.TemporaryDirectory() as cache_dir:
+        calc.cache_manager = CacheManager(cache_dir)
+        wall, work, unit = BENCHES[bench](view)
+        close_pool()
+    return {'wall': wall, 'throughput': work / wall if wall > 0 else 0.0, 'unit': f'{unit}/s',
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT / 2 ** 20,
+            'worker_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * RSS_UNIT / 2 ** 20}
+
+
+def run_isolated(case) -> dict:
+    """
+    Run one case in a fresh interpreter, so that its peak memory is its own.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        out = os.path.join(directory, 'result.json')
+        subprocess.run([sys.executable, '-m', 'tests.benchmark', '--case', case, '--out', out], check=True, stdout=subprocess.DEVNULL)
+        with open(out) as f:
+            return json.load(f)
+
+
+def regressions(results: dict, baseline: dict, threshold=THRESHOLD) -> list[str]:
+    """
+    The cases whose wall time or peak memory exceed the baseline by more than threshold.
+    """
+    found = []
+    for case, result in results.items():
+        if case not in baseline:
+            continue
+        for metric in ('wall', 'peak_rss_mb'):
+            before, after = baseline[case][metric], result[metric]
+            if before > 0 and after > before * (1 + threshold):
+                found.append(f"{case}: {metric} {before:.3g} -> {after:.3g} (+{after / before - 1:.0%})")
+    return found
+
+
+def report(results: dict, baseline: dict):
+    print(f"{'case':<20} {'wall s':>9} {'throughput':>24} {'peak MB':>8} {'worker MB':>9} {'vs baseline':>12}")
+    for case, result in results.items():
+        change = f"{result['wall'] / baseline[case]['wall'] - 1:+.0%}" if case in baseline and baseline[case]['wall'] > 0 else ''
+        print(f"{case:<20} {result['wall']:>9.4f} {result['throughput']:>10.3g} {result['unit']:<13} "
+              f"{result['peak_rss_mb']:>8.0f} {result['worker_rss_mb']:>9.0f} {change:>12}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the kernels, renders, cache and coloring over the views of mandelbrot.py. "
+                                                 "Run from the repository root as python -m tests.benchmark.")
+    parser.add_argument('cases', nargs='*', default=CASES, help=f"cases to run, among {' '.join(CASES)}")
+    parser.add_argument('--baseline', default=BASELINE, help="JSON baseline to compare with or save to")
+    parser.add_argument('--save', action='store_true', help="save the results as the baseline")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help="relative regression that fails the run")
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    parser.add_argument('--out', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.case:
+        with open(args.out, 'w') as f:
+            json.dump(run_case(args.case), f)
+        return 0
+
+    results = {case: run_isolated(case) for case in args.cases}
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['cases']
+    report(results, baseline)
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump({'machine': platform.platform(), 'processor': platform.processor(), 'cpu_count': os.cpu_count(),
+                       'cases': {**baseline, **results}}, f, indent=2)
+        print(f"Saved baseline {args.baseline}")
+        return 0
+    if not baseline:
+        print(f"No baseline {args.baseline} to compare with: run with --save to record one")
+        return 1
+    found = regressions(results, baseline, args.threshold)
+    for line in found:
+        print(f"Regression: {line}")
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
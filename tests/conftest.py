@@ -0,0 +1,37 @@
+import time
+from dataclasses import astuple
+
+import numpy as np
+import pytest
+from matplotlib import pyplot as plt
+from matplotlib.widgets import Button, TextBox
+
+from constructs import calc
+from constructs.cache import CacheManager
+from constructs.model import PlotHandle, MandelbrotData
+
+
+@pytest.fixture
+def tmp_cache(tmp_path, monkeypatch):
+    cache_manager = CacheManager(str(tmp_path / 'cache'))
+    monkeypatch.setattr(calc, 'cache_manager', cache_manager)
+    return cache_manager
+
+
+@pytest.fixture
+def fake_progressive():
+    def progressive(specs, regen=False, cancel_event=None):
+        for stride in (4, 2, 1):
+            time.sleep(.05)
+            shape = (specs.height // stride, specs.width // stride)
+            yield MandelbrotData(np.full(shape, float(specs.iterations)), np.zeros(shape, dtype=bool), np.array(astuple(specs)))
+    return progressive
+
+
+@pytest.fixture
+def fake_handle():
+    fig, ax = plt.subplots()
+    im = ax.imshow(np.zeros((10, 16, 3), dtype=np.uint8))
+    axbox = plt.axes((0.36, 0.92, 0.08, 0.03))
+    yield PlotHandle(fig, ax, im, None, Button(axbox, 'Undo'), Button(axbox, 'Undo'), Button(axbox, 'Undo'), TextBox(axbox, ''), 10)
+    plt.close(fig)
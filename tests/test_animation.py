@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from constructs import animation, calc
+from constructs.animation import zoom_path, scaled_specs, frame_scales, keyframe_scales, keyframe_index, resample, zoom_frames
+from constructs.model import PlotSpecs
+
+
+def test_zoom_path_reaches_end():
+    start = PlotSpecs(-2.0, 1.0, -1.0, 1.0, 100, 48, 32)
+    end = PlotSpecs(-0.8, -0.425, 0.0, 0.25, 300, 48, 32)
+    px, py, scale = zoom_path(start, end)
+    assert scale == pytest.approx(1 / 8)
+    reached = scaled_specs(start, px, py, scale, 300, 48, 32)
+    assert np.allclose([reached.xmin, reached.xmax, reached.ymin, reached.ymax], [end.xmin, end.xmax, end.ymin, end.ymax])
+
+
+def test_frames_come_from_the_narrowest_keyframe_containing_them():
+    scales = frame_scales(1 / 8, 10)
+    key_scales = keyframe_scales(scales)
+    assert np.allclose(key_scales, [1, 1 / 2, 1 / 4, 1 / 8])
+    index = keyframe_index(scales, key_scales)
+    assert (key_scales[index] >= scales * (1 - 1e-9)).all() and (key_scales[index] < 2 * scales).all()
+    # zooming out uses the same keyframes in reverse
+    assert keyframe_index(scales[::-1], key_scales).tolist() == index[::-1].tolist()
+
+
+def test_resample_identity_and_midpoints():
+    img = np.arange(4 * 6 * 3, dtype=np.uint8).reshape(4, 6, 3)
+    assert np.array_equal(resample(img, np.arange(6.0), np.arange(4.0)), img)
+    half = resample(img, np.array([.5]), np.array([0.0]))
+    assert np.array_equal(half[0, 0], np.rint((img[0, 0].astype(float) + img[0, 1]) / 2))
+
+
+def test_zoom_frames_stream_in_order(tmp_cache):
+    start = PlotSpecs(-2.0, 1.0, -1.0, 1.0, 100, 240, 160)
+    end = PlotSpecs(-0.8, -0.425, 0.0, 0.25, 100, 240, 160)
+    frames = list(zoom_frames(start, end, 10))
+    assert [n for n, _ in frames] == list(range(10))
+    assert all(rgb.shape == (160, 240, 3) and rgb.dtype == np.uint8 for _, rgb in frames)
+    assert not tmp_cache.tiles and not tmp_cache.disk
+    # the interior of every resampled frame agrees with a direct render of it, apart from a few boundary pixels
+    px, py, end_scale = zoom_path(start, end)
+    scales = frame_scales(end_scale, 10)
+    agreement = [np.mean((rgb == 0).all(-1)[::-1] == calc.data_gen(scaled_specs(start, px, py, scales[n], 100, 240, 160)).interior)
+                 for n, rgb in frames]
+    assert min(agreement) > 0.98 and np.mean(agreement) > 0.985
+
+
+def test_keyframes_share_one_color_scale(tmp_cache, monkeypatch):
+    colorize, scales = animation.colorize, []
+    monkeypatch.setattr(animation, 'colorize', lambda *args, vmax=None, **kwargs: scales.append(vmax) or colorize(*args, vmax=vmax, **kwargs))
+    start = PlotSpecs(-2.0, 1.0, -1.0, 1.0, 100, 48, 32)
+    end = PlotSpecs(-0.8, -0.425, 0.0, 0.25, 300, 48, 32)
+    list(zoom_frames(start, end, 4))
+    assert len(scales) == 4 and set(scales) == {300}
@@ -0,0 +1,64 @@
+import json
+
+import numpy as np
+import pytest
+from matplotlib import image
+
+from constructs import batch
+from constructs.batch import load_specs, render_batch, render_blocks
+from constructs.model import PlotSpecs, MandelbrotData
+
+
+def test_load_specs_from_json_and_csv(tmp_path):
+    (tmp_path / 'views.json').write_text(json.dumps([
+        {'xmin': -2.0, 'xmax': 1.0, 'ymin': -1.0, 'ymax': 1.0, 'iterations': 100, 'width': 96, 'height': 64},
+        [-1.0, 0.0, -0.5, 0.5, 200, 32, 32],
+    ]))
+    (tmp_path / 'views.csv').write_text("xmin,xmax,ymin,ymax,iterations,width,height\n-2.0,1.0,-1.0,1.0,100,96,64\n-1.0,0.0,-0.5,0.5,,32,32\n")
+    from_json = load_specs(str(tmp_path / 'views.json'))
+    from_csv = load_specs(str(tmp_path / 'views.csv'))
+    assert from_json[0] == from_csv[0] == PlotSpecs(-2.0, 1.0, -1.0, 1.0, 100, 96, 64)
+    assert from_json[1] == PlotSpecs(-1.0, 0.0, -0.5, 0.5, 200, 32, 32)
+    assert from_csv[1] == PlotSpecs(-1.0, 0.0, -0.5, 0.5, None, 32, 32)
+
+
+@pytest.mark.parametrize('palette', ['linear', 'histogram'])
+def test_blocks_match_a_single_render(tmp_cache, tmp_path, palette):
+    specs = PlotSpecs(-2.0, 1.0, -1.0, 1.0, 100, 96, 64)
+    whole, = render_batch([specs], str(tmp_path / 'whole'), 'npy', palette, block=128)
+    blocks, = render_batch([specs], str(tmp_path / 'blocks'), 'npy', palette, block=24)
+    png, = render_batch([specs], str(tmp_path / 'png'), 'png', palette, block=24)
+    expected = np.load(whole)
+    assert expected.shape == (64, 96, 3)
+    assert np.array_equal(np.load(blocks), expected)
+    assert np.array_equal(np.round(image.imread(png) * 255).astype(np.uint8), expected)
+    assert sorted(path.name for path in (tmp_path / 'blocks').iterdir()) == ['view-0000.npy']
+    assert not tmp_cache.tiles and not tmp_cache.disk
+
+
+def test_deep_blocks_join_seamlessly(tmp_cache, tmp_path):
+    specs = PlotSpecs(-0.75, -0.75 + 4e-14, 0.1, 0.1 + 3e-14, 300, 64, 48)
+    (tmp_path / 'whole').mkdir()
+    (tmp_path / 'blocks').mkdir()
+    whole, whole_interior = render_blocks(specs, str(tmp_path / 'whole'), block=64)
+    blocks, blocks_interior = render_blocks(specs, str(tmp_path / 'blocks'), block=20)
+    assert np.array_equal(blocks_interior, whole_interior)
+    assert np.allclose(blocks, whole, atol=1e-6)
+    assert not tmp_cache.directory
+
+
+def test_blocks_cover_a_large_view_once(tmp_path, monkeypatch):
+    rendered = []
+
+    def fake_regen(specs, cancel_event, commit=True):
+        assert not commit
+        rendered.append(specs)
+        shape = (specs.height, specs.width)
+        return MandelbrotData(np.full(shape, float(len(rendered))), np.zeros(shape, dtype=bool), None)
+
+    monkeypatch.setattr(batch, 'data_regen', fake_regen)
+    specs = PlotSpecs(-2.0, 1.0, -1.0, 1.0, 100, 32768, 2048)  # 32k wide, kept short to spare the disk
+    escapes, _ = render_blocks(specs, str(tmp_path), block=1024)
+    assert len(rendered) == 64 and all(block.width == block.height == 1024 for block in rendered)
+    assert escapes[::1024, ::1024].ravel().tolist() == list(range(1, 65))
+    assert rendered[1].xmin == pytest.approx(-2.0 + 1024 * 3.0 / 32767) and rendered[-1].xmax == pytest.approx(1.0)
@@ -0,0 +1,20 @@
+from tests import benchmark
+from tests.benchmark import CASES, regressions
+
+
+def test_regressions_beyond_threshold():
+    baseline = {'calc-shallow': {'wall': 1.0, 'peak_rss_mb': 100.0}, 'viz-shallow': {'wall': 1.0, 'peak_rss_mb': 100.0}}
+    results = {'calc-shallow': {'wall': 1.2, 'peak_rss_mb': 140.0}, 'viz-shallow': {'wall': 1.5, 'peak_rss_mb': 90.0},
+               'load-shallow': {'wall': 9.0, 'peak_rss_mb': 900.0}}
+    found = regressions(results, baseline, .25)
+    assert len(found) == 2
+    assert found[0].startswith('calc-shallow: peak_rss_mb') and found[1].startswith('viz-shallow: wall')
+    assert {'calc-deep', 'regen-overflow', 'commit-shallow', 'load-shallow'} <= set(CASES)
+
+
+def test_missing_baseline_fails_unless_saved(tmp_path, monkeypatch):
+    monkeypatch.setattr(benchmark, 'run_isolated', lambda case: {'wall': 1.0, 'throughput': 1.0, 'unit': 'pixels/s', 'peak_rss_mb': 100.0, 'worker_rss_mb': 0.0})
+    path = str(tmp_path / 'baseline.json')
+    assert benchmark.main(['calc-shallow', '--baseline', path]) == 1
+    assert benchmark.main(['calc-shallow', '--baseline', path, '--save']) == 0
+    assert benchmark.main(['calc-shallow', '--baseline', path]) == 0
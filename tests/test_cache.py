@@ -0,0 +1,86 @@
+import os
+from dataclasses import astuple
+
+import numpy as np
+import pytest
+
+from constructs.cache import CacheManager
+from constructs.model import PlotSpecs, MandelbrotData
+from constructs.tiles import tile_specs
+
+
+def tile(level, tx, ty, iterations=100):
+    specs = tile_specs(level, tx, ty, iterations)
+    escapes = np.full((specs.height, specs.width), float(tx))
+    return MandelbrotData(escapes, np.zeros(escapes.shape, dtype=bool), np.array(astuple(specs)), np.zeros(escapes.shape, dtype=complex))
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    cache_manager = CacheManager(str(tmp_path))
+    cache_manager.commit_tile(0, 0, 0, tile(0, 0, 0))
+    cache_manager.disk_budget = 2.5 * cache_manager.disk_bytes
+    cache_manager.commit_tile(0, 1, 0, tile(0, 1, 0))
+    cache_manager.get_tile(0, 0, 0, 100)
+    cache_manager.commit_tile(0, 2, 0, tile(0, 2, 0))
+
+    assert cache_manager.tile_exists(0, 0, 0, 100)
+    assert not cache_manager.tile_exists(0, 1, 0, 100)
+    assert cache_manager.tile_exists(0, 2, 0, 100)
+    assert len(list(tmp_path.glob('tmp-tile-*'))) == 2
+
+
+def test_ram_tier_is_bounded(tmp_path):
+    cache_manager = CacheManager(str(tmp_path), ram_budget=1)
+    cache_manager.commit_tile(0, 0, 0, tile(0, 0, 0))
+    assert not cache_manager.ram
+    assert cache_manager.get_tile(0, 0, 0, 100).escapes[0, 0] == 0
+
+
+def test_index_survives_restart(tmp_path):
+    cache_manager = CacheManager(str(tmp_path))
+    cache_manager.commit_tile(0, 3, -1, tile(0, 3, -1))
+    specs = PlotSpecs(-0.75, -0.74, 0.1, 0.11, 100, 16, 10)
+    cache_manager.commit(specs, MandelbrotData(np.zeros((10, 16)), np.zeros((10, 16), dtype=bool), np.array(astuple(specs)), np.zeros((10, 16), dtype=complex)))
+    cache_manager.save_index()
+
+    restarted = CacheManager(str(tmp_path))
+    assert restarted.tile_exists(0, 3, -1, 100)
+    assert restarted.get_tile(0, 3, -1, 100).escapes[0, 0] == 3
+    assert restarted.exists(specs)
+    assert restarted.disk_bytes == cache_manager.disk_bytes
+
+
+def test_compact_encoding_roundtrip(tmp_path):
+    specs = tile_specs(0, 0, 0, 100)
+    rng = np.random.default_rng(0)
+    interior = rng.random((specs.height, specs.width)) < .5
+    escapes = np.where(interior, 0, rng.random(interior.shape) * 100)
+    Z = np.where(interior, rng.random(interior.shape) + 1j * rng.random(interior.shape), 0).astype(np.clongdouble)
+    dataset = MandelbrotData(escapes, interior, np.array(astuple(specs)), Z)
+    cache_manager = CacheManager(str(tmp_path), ram_budget=0)
+    cache_manager.commit_tile(0, 0, 0, dataset)
+
+    loaded = cache_manager.get_tile(0, 0, 0, 100)
+    assert np.array_equal(loaded.interior, interior)
+    assert np.allclose(loaded.escapes, escapes, rtol=1e-6)
+    assert loaded.Z is None and not isinstance(loaded.escapes, np.memmap)  # tiles are too small to hold a file open
+    continued = cache_manager.get_closest_tile(0, 0, 0, 200)
+    assert np.array_equal(continued.Z, Z)
+    assert cache_manager.disk_bytes < (escapes.nbytes + interior.nbytes + Z.nbytes) / 2
+    # the RAM tier serves what a reload from disk would
+    warm = CacheManager(str(tmp_path / 'warm'))
+    warm.commit_tile(0, 0, 0, dataset)
+    assert np.array_equal(warm.get_tile(0, 0, 0, 100).escapes, loaded.escapes)
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason="needs /proc to count open files")
+def test_ram_tier_holds_no_file_open(tmp_path):
+    cache_manager = CacheManager(str(tmp_path))
+    for tx in range(300):
+        cache_manager.commit_tile(0, tx, 0, tile(0, tx, 0))
+    cache_manager.save_index()
+    restarted = CacheManager(str(tmp_path))
+    before = len(os.listdir('/proc/self/fd'))
+    tiles = [restarted.get_tile(0, tx, 0, 100) for tx in range(300)]
+    assert len(tiles) == len(restarted.ram) == 300
+    assert len(os.listdir('/proc/self/fd')) - before < 10
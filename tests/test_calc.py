@@ -0,0 +1,255 @@
+import threading
+import time
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from constructs import calc, workers
+from constructs.cache import ESCAPES_DTYPE
+from constructs.calc import PERIOD_TOL, PRECISION_TIERS, complex_type, precision_tier, use_perturbation, widest_tier, data_gen, data_gen_progressive, mandelbrot_calc, mandelbrot_calc_subdivide, clingrid, perturbation_regen, mandelbrot_calc_dcomplex, dclingrid, ddclingrid
+from constructs.decimal_complex import dcomplex_zeroes, ddcomplex_zeroes
+from constructs.model import PlotSpecs
+from constructs.perturbation import reference_orbit
+from constructs.tiles import tile_level, lattice_pitch, lattice_index, tile_specs, tiles_covering
+from constructs.workers import CancelFlag, estimate_costs, render_pool, run_shared, utilization
+
+
+def test_perturbation_matches_direct():
+    specs = PlotSpecs(-0.75, -0.74, 0.1, 0.11, 200, 64, 40)
+    C = clingrid(specs)
+    escapes, interior, _, _ = mandelbrot_calc(C, specs.iterations, np.zeros_like(C), None)
+
+    data = perturbation_regen(specs, None)
+    assert np.array_equal(data.interior, interior)
+    assert np.allclose(data.escapes, escapes, atol=1e-6)
+
+
+def test_reference_orbit_stops_on_cancel():
+    cancel_event = CancelFlag()
+    timer = threading.Timer(.2, cancel_event.set)
+    timer.start()
+    start = time.perf_counter()
+    orbit = reference_orbit(Decimal('-0.1'), Decimal('0.1'), 10 ** 6, 2, 60, cancel_event)  # interior, several seconds in full
+    assert time.perf_counter() - start < 2 and len(orbit) < 10 ** 6
+    cancel_event.close()
+
+
+def test_double_double_fallback_matches_perturbation(monkeypatch):
+    w = 1e-20
+    specs = PlotSpecs(-0.743643887037151 - w, -0.743643887037151 + w, 0.131825904205330 - w * .625, 0.131825904205330 + w * .625, 500, 64, 40)
+    data = perturbation_regen(specs, None)
+    monkeypatch.setattr(calc, 'MAX_REFERENCES', 0)  # every pixel goes to the double-double fallback, in chunks across the pool
+    fallback = perturbation_regen(specs, None)
+    assert np.array_equal(fallback.interior, data.interior)
+    assert np.allclose(fallback.escapes, data.escapes, atol=1e-6)
+
+
+def test_periodicity_retires_interior_only():
+    specs = PlotSpecs(-2.8, 2.0, -1.5, 1.5, 300, 96, 60)
+    C = clingrid(specs)
+    escapes, interior, _, periodic = mandelbrot_calc(C, specs.iterations, np.zeros_like(C), None)
+    assert periodic == 0
+
+    period_tol = PERIOD_TOL * 4.8 / 96
+    fast_escapes, fast_interior, _, periodic = mandelbrot_calc(C, specs.iterations, np.zeros_like(C), None, period_tol)
+    assert 0 < periodic <= np.count_nonzero(interior)
+    assert np.array_equal(fast_interior, interior)
+    assert np.array_equal(fast_escapes, escapes)
+
+
+def test_subdivision_matches_brute_force():
+    specs = PlotSpecs(-2.8, 2.0, -1.5, 1.5, 300, 160, 100)
+    C = clingrid(specs)
+    escapes, interior, _, _ = mandelbrot_calc(C, specs.iterations, np.zeros_like(C), None)
+
+    fast_escapes, fast_interior, Z, _ = mandelbrot_calc_subdivide(C, specs.iterations, np.zeros_like(C), None)
+    assert np.isnan(Z).any()
+    assert np.array_equal(fast_interior, interior)
+    assert np.array_equal(fast_escapes, escapes)
+
+
+def test_double_double_matches_decimal():
+    specs = PlotSpecs(-1.9449859379344914, -1.944985937926679, 5.225243506493812e-12, 1.3037743506493811e-11, 300, 16, 10)
+    C = dclingrid(specs)
+    escapes, interior, _ = mandelbrot_calc_dcomplex(C, specs.iterations, dcomplex_zeroes(C.shape), None)
+
+    C = ddclingrid(specs)
+    dd_escapes, dd_interior, _ = mandelbrot_calc_dcomplex(C, specs.iterations, ddcomplex_zeroes(C.shape), None)
+    assert np.array_equal(dd_interior, interior)
+    assert np.allclose(dd_escapes, escapes, atol=1e-9)
+
+
+def lattice_grid(specs, stride=1):
+    level = tile_level(specs)
+    pitch = lattice_pitch(level) * stride
+    tier = widest_tier(precision_tier(tile_specs(level, *key, specs.iterations)) for key in tiles_covering(specs, level))
+    x = np.rint(np.linspace(specs.xmin, specs.xmax, -(-specs.width // stride)) / pitch) * pitch
+    y = np.rint(np.linspace(specs.ymin, specs.ymax, -(-specs.height // stride)) / pitch) * pitch
+    return (x[np.newaxis, :] + 1j * y[:, np.newaxis]).astype(PRECISION_TIERS[tier])
+
+
+def test_every_pixel_gets_its_own_lattice_point():
+    views = [PlotSpecs(-0.862, -0.638, 0.03, 0.17, 100, 2560, 1600), PlotSpecs(-1.02, 0.02, -0.325, 0.325, 100, 2560, 1600),
+             PlotSpecs(-0.75, -0.74, 0.1, 0.11, 100, 2560, 1600), PlotSpecs(-0.75, -0.75 + 3e-12, 0.1, 0.1 + 1.875e-12, 100, 2560, 1600),
+             PlotSpecs(-2.0, 1.0, -0.1, 0.1, 100, 640, 480)]  # pixels far from square
+    for specs in views:
+        tx, lx, ty, ly = lattice_index(specs, tile_level(specs))
+        assert np.unique(tx * 128 + lx).size == specs.width and np.unique(ty * 128 + ly).size == specs.height
+    # deeper, lattice indices no longer fit in float64 and the view is rendered by perturbation instead
+    assert use_perturbation(PlotSpecs(-0.75, -0.75 + 2e-13, 0.1, 0.1 + 1.25e-13, 100, 2560, 1600))
+
+
+def test_tiles_match_lattice(tmp_cache):
+    specs = PlotSpecs(-2.8, 2.0, -1.5, 1.5, 200, 300, 190)
+    C = lattice_grid(specs)
+    escapes, interior, _, _ = mandelbrot_calc(C, specs.iterations, np.zeros_like(C), None)
+
+    data = data_gen(specs)
+    assert np.array_equal(data.interior, interior)
+    assert np.array_equal(data.escapes, escapes)
+
+
+def test_progressive_passes(tmp_cache):
+    specs = PlotSpecs(-2.8, 2.0, -1.5, 1.5, 200, 160, 100)
+    C = lattice_grid(specs)
+    escapes, interior, _, _ = mandelbrot_calc(C, specs.iterations, np.zeros_like(C), None)
+
+    passes = list(data_gen_progressive(specs, regen=True))
+    assert [data.escapes.shape for data in passes] == [(13, 20), (25, 40), (50, 80), (100, 160)]
+    C = lattice_grid(specs, 8)
+    coarse, _, _, _ = mandelbrot_calc(C, specs.iterations, np.zeros_like(C), None)
+    assert np.array_equal(passes[0].escapes, coarse)
+    assert np.array_equal(passes[-1].interior, interior)
+    assert np.array_equal(passes[-1].escapes, escapes)
+
+
+def test_pan_reuses_tiles(tmp_cache):
+    specs = PlotSpecs(-2.8, 2.0, -1.5, 1.5, 200, 300, 190)
+    data_gen(specs)
+    tiles = len(tmp_cache.tiles)
+
+    px, py = 4.8 / 299, 3.0 / 189
+    panned = PlotSpecs(specs.xmin + 70 * px, specs.xmax + 70 * px, specs.ymin - 30 * py, specs.ymax - 30 * py, 200, 300, 190)
+    data = data_gen(panned)
+    assert len(tmp_cache.tiles) - tiles < tiles
+    C = lattice_grid(panned)
+    escapes, interior, _, _ = mandelbrot_calc(C, panned.iterations, np.zeros_like(C), None)
+    assert np.array_equal(data.interior, interior)
+    assert np.array_equal(data.escapes, escapes.astype(ESCAPES_DTYPE))  # as the cache stores them
+
+
+def test_zoom_out_derives_tiles(tmp_cache):
+    specs = PlotSpecs(-1.0, -0.5, 0.0, 0.5, 100, 128, 128)
+    data_gen(specs)
+    zoomed_out = PlotSpecs(-1.5, -0.5, 0.0, 1.0, 100, 128, 128)
+    level = tile_level(zoomed_out)
+    assert level == tile_level(specs) - 1
+    assert tmp_cache.get_tile(level, -1, 0, 100) is not None
+
+
+def test_continuation_matches_fresh(tmp_cache):
+    specs = PlotSpecs(-0.75, -0.74, 0.1, 0.11, 100, 64, 40)
+    data_gen(specs)
+    deeper = PlotSpecs(-0.75, -0.74, 0.1, 0.11, 400, 64, 40)
+    data = data_gen(deeper)
+    C = lattice_grid(deeper)
+    escapes, interior, _, _ = mandelbrot_calc(C, deeper.iterations, np.zeros_like(C), None)
+    assert np.array_equal(data.interior, interior)
+    assert np.allclose(data.escapes, escapes)
+
+
+def test_fewer_iterations_derived_from_cache(tmp_cache):
+    data_gen(PlotSpecs(-0.75, -0.74, 0.1, 0.11, 400, 64, 40))
+    tiles = sum(len(entries) for entries in tmp_cache.tiles.values())
+    specs = PlotSpecs(-0.75, -0.74, 0.1, 0.11, 100, 64, 40)
+    data = data_gen(specs)
+    assert sum(len(entries) for entries in tmp_cache.tiles.values()) == tiles
+    C = lattice_grid(specs)
+    escapes, interior, _, _ = mandelbrot_calc(C, specs.iterations, np.zeros_like(C), None)
+    assert np.array_equal(data.interior, interior)
+    assert np.allclose(data.escapes, escapes)
+
+
+def calc_then_cancel(C, iterations, Z, cancel_event, period_tol=None):
+    results = mandelbrot_calc(C, iterations, Z, cancel_event, period_tol)
+    getattr(cancel_event, 'flag', cancel_event).set()  # the flag under the one the kernel reads
+    return results
+
+
+def test_part_done_before_the_cancel_completes():
+    cancel_event = CancelFlag()
+    C = np.full(64, -0.1 + 0.1j, dtype=complex_type)
+    escapes, interior, _, _, complete = run_shared(render_pool(calc.CPU_CORES), [(calc_then_cancel, C, np.zeros_like(C), 100)], cancel_event)
+    assert cancel_event.is_set() and complete == [True] and interior.all()
+    cancel_event.close()
+
+
+def test_cancelled_progressive_render_resumes(tmp_cache, monkeypatch):
+    specs = PlotSpecs(-2.8, 2.0, -1.5, 1.5, 200, 300, 190)
+    keys = tiles_covering(specs, tile_level(specs))
+    calc_pixels = calc.calc_pixels
+
+    def cancelled_halfway(pool, C, *args):
+        escapes, interior, Z, finished = calc_pixels(pool, C, *args)
+        if C.size > len(keys) * 128 * 128 // 2:  # the last pass: the tasks of the second half never ran
+            finished[C.size // 2:] = False
+        return escapes, interior, Z, finished
+
+    monkeypatch.setattr(calc, 'calc_pixels', cancelled_halfway)
+    passes = list(data_gen_progressive(specs))
+    assert not passes[-1].complete
+    cached = len(tmp_cache.tiles)
+    assert 0 < cached < len(keys)
+
+    monkeypatch.setattr(calc, 'calc_pixels', calc_pixels)
+    resumed = list(data_gen_progressive(specs))
+    assert resumed[-1].complete and len(tmp_cache.tiles) == len(keys)
+    assert np.array_equal(resumed[-1].interior, data_gen(specs, regen=True).interior)
+
+
+def test_costly_parts_rank_first():
+    inside = np.full(64, -0.1 + 0.1j, dtype=complex_type)
+    outside = np.full(64, 1.5 + 1.5j, dtype=complex_type)
+    parts = [(mandelbrot_calc, C, np.zeros_like(C), 500) for C in (outside, inside)]
+    costs = estimate_costs(parts)
+    assert costs[1] > 100 * costs[0]
+    # subdivision only iterates the border of an interior part
+    inside = np.full((16, 16), -0.1 + 0.1j, dtype=complex_type)
+    costs = estimate_costs([(kernel, inside, np.zeros_like(inside), 5000) for kernel in (mandelbrot_calc_subdivide, mandelbrot_calc)])
+    assert costs[0] < costs[1] / 2
+    assert utilization([(1, 2.0), (2, 1.0), (1, 1.0)], 4.0) == {1: .75, 2: .25}
+
+
+def test_cheap_runs_skip_the_estimate_and_report_to_the_caller(monkeypatch, capsys):
+    monkeypatch.setattr(workers, 'estimate_costs', lambda *args: pytest.fail('estimated a cheap run'))
+    C = np.full(64, -0.1 + 0.1j, dtype=complex_type)
+    parts = [(mandelbrot_calc, c, np.zeros_like(c), 100) for c in np.array_split(C, 16)]
+    timings = []
+    *_, complete = run_shared(render_pool(calc.CPU_CORES), parts, None, None, timings)
+    assert all(complete) and len(timings) == 16 and 'Workers:' not in capsys.readouterr().out
+
+def test_precision_tiers(tmp_cache):
+    assert precision_tier(PlotSpecs(-2.8, 2.0, -1.5, 1.5, 100, 640, 400)) == 'complex64'
+    assert precision_tier(PlotSpecs(-0.75, -0.7499, 0.1, 0.1001, 100, 640, 400)) == 'complex128'
+    assert precision_tier(PlotSpecs(-0.75, -0.75 + 1e-12, 0.1, 0.1 + 1e-12, 100, 640, 400)) == 'longdouble'
+    assert precision_tier(PlotSpecs(-0.75, -0.75 + 1e-14, 0.1, 0.1 + 1e-14, 100, 640, 400)) == 'extended'
+
+    specs = PlotSpecs(-0.75, -0.7499, 0.1, 0.1001, 100, 32, 20)
+    data_gen(specs)
+    tmp_cache.ram.clear()
+    assert data_gen(specs).precision == 'complex128'
+
+
+def test_cancel_returns_incomplete(tmp_cache):
+    cancel_event = CancelFlag()
+    specs = PlotSpecs(-0.76, -0.74, 0.09, 0.11, 20000, 256, 256)  # about 20 s to render in full
+    timer = threading.Timer(.3, cancel_event.set)
+    timer.start()
+    start = time.perf_counter()
+    data = data_gen(specs, cancel_event=cancel_event)
+    assert time.perf_counter() - start < 5
+    assert not data.complete
+    assert data.escapes.shape == (256, 256)
+    assert not any(tmp_cache.tile_exists(level, tx, ty, 20000) for level, tx, ty in tmp_cache.tiles)
+    cancel_event.close()
@@ -0,0 +1,93 @@
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from matplotlib import pyplot as plt
+from matplotlib.backend_bases import KeyEvent
+
+from constructs import controller
+from constructs.controller import MandelbrotCtrl
+from constructs.model import PlotSpecs
+from constructs.prefetch import prefetch_candidates, view_keys
+from constructs.tiles import lattice_index, tile_level
+from constructs.workers import CancelFlag
+
+
+def test_only_latest_request_is_delivered(monkeypatch, fake_handle, fake_progressive):
+    monkeypatch.setattr(controller, 'data_gen_progressive', fake_progressive)
+    handle = fake_handle
+    ctrl = MandelbrotCtrl(handle)
+
+    done = []
+    ctrl.request(PlotSpecs(-2.0, 1.0, -1.0, 1.0, 100, 16, 10), done.append)
+    time.sleep(.07)
+    ctrl.request(PlotSpecs(-2.0, 1.0, -1.0, 1.0, 200, 16, 10), done.append)
+    deadline = time.time() + 5
+    while not done and time.time() < deadline:
+        ctrl.deliver()
+        time.sleep(.01)
+    assert [specs.iterations for specs in done] == [200]
+    assert ctrl.data.escapes.shape == (10, 16) and ctrl.data.escapes[0, 0] == 200
+
+
+def test_prefetch_candidates_zoom_around_cursor():
+    view = PlotSpecs(-2.0, 1.0, -1.0, 1.0, 100, 16, 10)
+    history = [PlotSpecs(-2.0, 1.0, -1.0, 1.0, 50, 16, 10), view]
+    zoom_in, undo, zoom_out = prefetch_candidates(view, (0.0, 0.5), 0.5, history, 1)
+    assert (zoom_in.xmin, zoom_in.xmax, zoom_in.ymin, zoom_in.ymax) == (-0.75, 0.75, 0.0, 1.0)
+    assert undo is history[0]
+    assert (zoom_out.xmin, zoom_out.xmax, zoom_out.ymin, zoom_out.ymax) == (-3.0, 3.0, -1.5, 2.5)
+
+
+def test_prefetched_view_counts_as_hit(monkeypatch, fake_handle, fake_progressive):
+    prefetched = []
+
+    def fake_data_gen(specs, regen=False, cancel_event=None):
+        prefetched.append(specs)
+        return next(fake_progressive(specs))
+
+    monkeypatch.setattr(controller, 'data_gen_progressive', fake_progressive)
+    monkeypatch.setattr(controller, 'data_gen', fake_data_gen)
+    monkeypatch.setattr(controller, 'is_cached', lambda specs: False)
+    handle = fake_handle
+    ctrl = MandelbrotCtrl(handle, cancel_event=CancelFlag())
+    ctrl.cursor = (0.0, 0.5)
+
+    done = []
+    ctrl.request(PlotSpecs(-2.0, 1.0, -1.0, 1.0, 100), done.append)
+    deadline = time.time() + 5
+    while len(prefetched) < 2 and time.time() < deadline:
+        ctrl.deliver()
+        time.sleep(.01)
+    zoom_in, zoom_out = prefetched
+    assert zoom_in.xmax - zoom_in.xmin == 1.5 and zoom_out.xmax - zoom_out.xmin == 6.0
+    ctrl.count_prefetch_hit(zoom_in)
+    assert (ctrl.prefetch_hits, ctrl.prefetch_requests) == (1, 2)
+    assert view_keys(zoom_in).keys() <= ctrl.prefetched.keys()
+
+
+def test_palette_key_does_not_toggle_pan(fake_handle):
+    handle = fake_handle
+    MandelbrotCtrl(handle, prefetch=False)
+    canvas = handle.fig.canvas
+    canvas.toolbar = SimpleNamespace(pan=lambda: toggled.append('pan'), zoom=lambda: toggled.append('zoom'),
+                                     _update_cursor=lambda event: None)
+    toggled = []
+    for key in ('p', 'o'):
+        canvas.callbacks.process('key_press_event', KeyEvent('key_press_event', canvas, key))
+    assert toggled == ['zoom'] and plt.rcParams['keymap.pan'] == ['p']
+
+
+def test_click_shifts_by_whole_lattice_pitches(fake_handle):
+    handle = fake_handle
+    ctrl = MandelbrotCtrl(handle, prefetch=False)
+    requested = []
+    ctrl.request = lambda specs, on_done=None: requested.append(specs)
+    view = PlotSpecs(-2.0, 1.0, -1.0, 1.0, handle.iterations)
+    handle.ax.set_xlim(view.xmin, view.xmax)
+    handle.ax.set_ylim(view.ymin, view.ymax)
+    ctrl.on_click(SimpleNamespace(inaxes=handle.ax, button=1, xdata=-0.3, ydata=0.2))
+    level = tile_level(view)
+    (tx, lx, ty, ly), (ux, mx, uy, my) = lattice_index(view, level), lattice_index(requested[0], level)
+    # the recentered view samples the same lattice points as the current one, shifted as a whole
+    assert np.unique(ux * 128 + mx - tx * 128 - lx).size == 1 and np.unique(uy * 128 + my - ty * 128 - ly).size == 1
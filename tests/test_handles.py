@@ -37,11 +37,11 @@ def test_zoom_left_click(qtbot):
     # Optionally, assert something after the zoom
     xlim = ax.get_xlim()
     ylim = ax.get_ylim()
-    # the plot is re-centered on the click point
+    # the plot is re-centered on the pixel nearest to the click point
     actual_xlim = sum(xlim)
     actual_ylim = sum(ylim)
-    assert np.isclose(actual_xlim, 0.8185483870967731), f'actual_xlim: {actual_xlim}'
-    assert np.isclose(actual_ylim, 0.07359307359307365), f'actual_ylim: {actual_ylim}'
+    assert np.isclose(actual_xlim, 0.8190699491989059), f'actual_xlim: {actual_xlim}'
+    assert np.isclose(actual_ylim, 0.075046904315197), f'actual_ylim: {actual_ylim}'
 
     # the limit is not changed
     assert np.isclose(xlim[1] - xlim[0], xlim_before[1] - xlim_before[0])
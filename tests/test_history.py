@@ -0,0 +1,50 @@
+import numpy as np
+
+from constructs import history
+from constructs.history import HistoryCtrl
+from constructs.model import PlotSpecs
+
+
+def render(handle, value):
+    handle.img = np.full((10, 16, 3), value, dtype=np.uint8)
+    handle.im.set_data(handle.img)
+    return handle
+
+
+def test_undo_redo_reuse_frames(monkeypatch, fake_handle, fake_progressive):
+    rendered = []
+
+    def fake_data_gen(specs, regen=False, cancel_event=None):
+        rendered.append(specs)
+        return next(fake_progressive(specs))
+
+    monkeypatch.setattr(history, 'data_gen', fake_data_gen)
+    handle = render(fake_handle, 1)
+    ctrl = HistoryCtrl(handle)
+    handle.img[:] = 2
+    zoomed = PlotSpecs(-1.0, 0.0, -0.5, 0.5, 10, 16, 10)
+    ctrl.remember_frame(zoomed)
+    ctrl.append(zoomed)
+
+    ctrl.undo(None)
+    assert (handle.im.get_array() == 1).all()
+    ctrl.redo(None)
+    assert (handle.im.get_array() == 2).all()
+    ctrl.reset(None)
+    assert (handle.im.get_array() == 1).all() and ctrl.history[-1] == ctrl.init_specs
+    assert rendered == []
+
+    # a new palette makes the kept frames stale: they are shown until the render replaces them
+    handle.palette = 'cyclic'
+    ctrl.undo(None)
+    assert rendered == [zoomed]
+
+
+def test_frames_fit_the_budget(fake_handle):
+    handle = render(fake_handle, 0)
+    ctrl = HistoryCtrl(handle, frame_budget=2 * 5 * 8 * 3, frame_stride=2)
+    assert ctrl.frames[next(iter(ctrl.frames))].img.shape == (5, 8, 3)
+    for n in range(3):
+        ctrl.remember_frame(PlotSpecs(-1.0, 0.0, -0.5, 0.5, 10 + n, 16, 10))
+    assert len(ctrl.frames) == 2 and ctrl.frame_bytes == 2 * 5 * 8 * 3
+    assert [key[4] for key in ctrl.frames] == [11, 12]
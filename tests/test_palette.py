@@ -0,0 +1,52 @@
+from dataclasses import astuple
+
+import numpy as np
+from matplotlib import pyplot as plt
+
+from constructs.model import CMAP_EXT, MandelbrotData, PlotSpecs
+from constructs.palette import LUT_SIZE, colorize, palette_index
+from constructs.viz import mandelbrot_viz, recolor
+
+
+def dataset():
+    rng = np.random.default_rng(0)
+    escapes = rng.exponential(20, (40, 64))
+    interior = rng.random(escapes.shape) < .2
+    escapes[interior] = 0
+    return MandelbrotData(escapes, interior, np.array(astuple(PlotSpecs(-2.0, 1.0, -1.0, 1.0, 100, 64, 40))))
+
+
+def test_linear_palette_matches_colormap():
+    data = dataset()
+    img = data.to_viz_data().img
+    expected = np.round(CMAP_EXT(data.escapes / data.escapes.max())[..., :3] * 255)
+    expected[data.interior] = 0
+    assert img.dtype == np.uint8
+    assert np.abs(img - expected).max() <= 1
+
+
+def test_histogram_palette_spreads_colors():
+    data = dataset()
+    index = palette_index(data.escapes, data.interior, 'histogram')[~data.interior]
+    counts = np.bincount(index * 4 // LUT_SIZE, minlength=4)
+    assert counts.min() > .15 * index.size
+
+
+def test_recolor_reuses_buffer():
+    data = dataset()
+    buffer = data.to_viz_data().img
+    img = data.to_viz_data('cyclic', out=buffer).img
+    assert img is buffer
+    assert not np.array_equal(img, colorize(data.escapes, data.interior, CMAP_EXT))
+
+
+def test_colorbar_follows_the_palette():
+    data = dataset()
+    for palette in ('linear', 'histogram'):
+        viz = data.to_viz_data(palette)
+        shown = np.round(viz.cmap((data.escapes - viz.vmin) / (viz.vmax - viz.vmin))[..., :3] * 255)
+        assert np.array_equal(shown[~data.interior], viz.img[~data.interior])
+    handle = mandelbrot_viz(data)
+    recolor(data, handle, 'histogram')
+    assert handle.cbar.cmap.name == 'electric-histogram'
+    plt.close(handle.fig)